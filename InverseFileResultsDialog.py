@@ -28,17 +28,11 @@ class Ui_InverseFileResultsDialog(object):
         InverseFileResultsDialog.resize(618, 300)
         self.verticalLayout = QtGui.QVBoxLayout(InverseFileResultsDialog)
         self.verticalLayout.setObjectName(_fromUtf8("verticalLayout"))
-        self.inverseFileResultsTableWidget = QtGui.QTableWidget(InverseFileResultsDialog)
-        self.inverseFileResultsTableWidget.setEditTriggers(QtGui.QAbstractItemView.NoEditTriggers)
-        self.inverseFileResultsTableWidget.setObjectName(_fromUtf8("inverseFileResultsTableWidget"))
-        self.inverseFileResultsTableWidget.setColumnCount(2)
-        self.inverseFileResultsTableWidget.setRowCount(0)
-        item = QtGui.QTableWidgetItem()
-        self.inverseFileResultsTableWidget.setHorizontalHeaderItem(0, item)
-        item = QtGui.QTableWidgetItem()
-        self.inverseFileResultsTableWidget.setHorizontalHeaderItem(1, item)
-        self.inverseFileResultsTableWidget.horizontalHeader().setStretchLastSection(True)
-        self.verticalLayout.addWidget(self.inverseFileResultsTableWidget)
+        self.inverseFileResultsTableView = QtGui.QTableView(InverseFileResultsDialog)
+        self.inverseFileResultsTableView.setEditTriggers(QtGui.QAbstractItemView.NoEditTriggers)
+        self.inverseFileResultsTableView.setObjectName(_fromUtf8("inverseFileResultsTableView"))
+        self.inverseFileResultsTableView.horizontalHeader().setStretchLastSection(True)
+        self.verticalLayout.addWidget(self.inverseFileResultsTableView)
         self.inverseFileResultsButtonBox = QtGui.QDialogButtonBox(InverseFileResultsDialog)
         self.inverseFileResultsButtonBox.setStandardButtons(QtGui.QDialogButtonBox.Ok)
         self.inverseFileResultsButtonBox.setObjectName(_fromUtf8("inverseFileResultsButtonBox"))
@@ -50,9 +44,5 @@ class Ui_InverseFileResultsDialog(object):
 
     def retranslateUi(self, InverseFileResultsDialog):
         InverseFileResultsDialog.setWindowTitle(_translate("InverseFileResultsDialog", "Recherche d\'informations - Résultats", None))
-        self.inverseFileResultsTableWidget.setSortingEnabled(True)
-        item = self.inverseFileResultsTableWidget.horizontalHeaderItem(0)
-        item.setText(_translate("InverseFileResultsDialog", "Objet", None))
-        item = self.inverseFileResultsTableWidget.horizontalHeaderItem(1)
-        item.setText(_translate("InverseFileResultsDialog", "Poids", None))
+        self.inverseFileResultsTableView.setSortingEnabled(True)
 
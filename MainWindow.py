@@ -128,21 +128,15 @@ class Ui_MainWindow(object):
         self.ResultsGroupBox.setObjectName(_fromUtf8("ResultsGroupBox"))
         self.verticalLayout_2 = QtGui.QVBoxLayout(self.ResultsGroupBox)
         self.verticalLayout_2.setObjectName(_fromUtf8("verticalLayout_2"))
-        self.resultsTableWidget = QtGui.QTableWidget(self.ResultsGroupBox)
-        self.resultsTableWidget.setAutoFillBackground(False)
-        self.resultsTableWidget.setEditTriggers(QtGui.QAbstractItemView.NoEditTriggers)
-        self.resultsTableWidget.setSelectionMode(QtGui.QAbstractItemView.SingleSelection)
-        self.resultsTableWidget.setSelectionBehavior(QtGui.QAbstractItemView.SelectRows)
-        self.resultsTableWidget.setObjectName(_fromUtf8("resultsTableWidget"))
-        self.resultsTableWidget.setColumnCount(2)
-        self.resultsTableWidget.setRowCount(0)
-        item = QtGui.QTableWidgetItem()
-        self.resultsTableWidget.setHorizontalHeaderItem(0, item)
-        item = QtGui.QTableWidgetItem()
-        self.resultsTableWidget.setHorizontalHeaderItem(1, item)
-        self.resultsTableWidget.horizontalHeader().setCascadingSectionResizes(False)
-        self.resultsTableWidget.horizontalHeader().setStretchLastSection(True)
-        self.verticalLayout_2.addWidget(self.resultsTableWidget)
+        self.resultsTableView = QtGui.QTableView(self.ResultsGroupBox)
+        self.resultsTableView.setAutoFillBackground(False)
+        self.resultsTableView.setEditTriggers(QtGui.QAbstractItemView.NoEditTriggers)
+        self.resultsTableView.setSelectionMode(QtGui.QAbstractItemView.SingleSelection)
+        self.resultsTableView.setSelectionBehavior(QtGui.QAbstractItemView.SelectRows)
+        self.resultsTableView.setObjectName(_fromUtf8("resultsTableView"))
+        self.resultsTableView.horizontalHeader().setCascadingSectionResizes(False)
+        self.resultsTableView.horizontalHeader().setStretchLastSection(True)
+        self.verticalLayout_2.addWidget(self.resultsTableView)
         self.clearResultsPushButton = QtGui.QPushButton(self.ResultsGroupBox)
         self.clearResultsPushButton.setObjectName(_fromUtf8("clearResultsPushButton"))
         self.verticalLayout_2.addWidget(self.clearResultsPushButton)
@@ -354,12 +348,8 @@ class Ui_MainWindow(object):
         self.matchingScoreSearchPushButton.setText(_translate("MainWindow", "Rechercher", None))
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.matchingScoreTab), _translate("MainWindow", "Matching score", None))
         self.ResultsGroupBox.setTitle(_translate("MainWindow", "Résultats", None))
-        self.resultsTableWidget.setToolTip(_translate("MainWindow", "Double-click sur un document pour l\'ouvrir", None))
-        self.resultsTableWidget.setSortingEnabled(True)
-        item = self.resultsTableWidget.horizontalHeaderItem(0)
-        item.setText(_translate("MainWindow", "Document", None))
-        item = self.resultsTableWidget.horizontalHeaderItem(1)
-        item.setText(_translate("MainWindow", "Score", None))
+        self.resultsTableView.setToolTip(_translate("MainWindow", "Double-click sur un document pour l\'ouvrir", None))
+        self.resultsTableView.setSortingEnabled(True)
         self.clearResultsPushButton.setText(_translate("MainWindow", "Effacer les résultats", None))
         self.mainTabs.setTabText(self.mainTabs.indexOf(self.searchTab), _translate("MainWindow", "Recherche", None))
         self.cacmDocumentsGroupBox.setTitle(_translate("MainWindow", "Documents CACM", None))
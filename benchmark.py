@@ -0,0 +1,260 @@
+"""
+Benchmark of the search engine over the CACM collection and its scale-ups, writing the results as JSON.
+Each scale is built and searched in fresh processes, so that their memory measures do not add up.
+
+python benchmark.py run --scales 1 10 100 --output results.json
+python benchmark.py run --scales 10 100 1000 --synthetic --output results.json
+python benchmark.py compare before.json after.json
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from os import cpu_count
+from os.path import join, dirname, getsize
+try:
+    import resource
+except ImportError:  # Not on Windows: the peak memory is not measured.
+    resource = None
+
+from core import CACMParser, InverseFileWriter, TfIdfFileWriter, DocumentStore, InverseFileReader, \
+    ProbabilisticScorer, QueryPreprocessing
+from evaluation import TestCollection
+from server import percentile
+from synthetic import CollectionModel, CollectionGenerator
+
+cacm_all_default_path = join(dirname(__file__), 'cacm', 'cacm.all')
+common_words_default_path = join(dirname(__file__), 'cacm', 'common_words')
+query_default_path = join(dirname(__file__), 'cacm', 'query.text')
+qrels_default_path = join(dirname(__file__), 'cacm', 'qrels.text')
+models = ('inner_product', 'dice', 'cos', 'jaccard') + ProbabilisticScorer.models + ('matching_score', 'boolean')
+
+
+def scale_collection(source_path, target_path, factor):
+    """
+    Write a collection made of factor copies of the documents of another, numbered one after the other.
+    :return: int number of documents written.
+    """
+    documents = list(CACMParser(source_path))
+    with open(source_path, 'rb') as source_file, open(target_path, 'wb') as target_file:
+        number = 0
+        for _ in range(factor):
+            for document in documents:
+                source_file.seek(document.get_offset())
+                data = source_file.read(document.get_length())
+                number += 1
+                target_file.write('.I {}'.format(number).encode() + data[data.index(b'\n'):])
+    return number
+
+
+def resident_memory():  # Current resident set size in bytes, None if unknown.
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except (OSError, AttributeError):
+        return None
+
+
+def peak_memory():  # Peak resident set size in bytes of the process, None if unknown.
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+def latencies_summary(latencies):
+    latencies = sorted(latencies)
+    return {
+        'count': len(latencies),
+        'mean_ms': sum(latencies) / len(latencies) * 1000,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p90_ms': percentile(latencies, 0.9) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': latencies[-1] * 1000,
+    }
+
+
+def benchmark_build(collection_path, inverse_file_path, tf_idf_file_path, common_words_path):
+    """
+    Worker task: time the parsing of a collection and the building of its inverse files.
+    """
+    QueryPreprocessing.load_stop_list(common_words_path)
+    start = time.perf_counter()
+    documents_count = sum(1 for _ in CACMParser(collection_path))
+    parse_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    InverseFileWriter(CACMParser(collection_path), inverse_file_path)
+    build_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    TfIdfFileWriter(collection_path, tf_idf_file_path)
+    tf_idf_build_seconds = time.perf_counter() - start
+    return {
+        'documents': documents_count,
+        'parse_seconds': parse_seconds,
+        'build_seconds': build_seconds,
+        'tf_idf_build_seconds': tf_idf_build_seconds,
+        'build_peak_memory_bytes': peak_memory(),
+        'index_bytes': getsize(inverse_file_path),
+        'tf_idf_index_bytes': getsize(tf_idf_file_path),
+        'document_store_bytes': getsize(DocumentStore.path_for(inverse_file_path)),
+    }
+
+
+def benchmark_search(inverse_file_path, common_words_path, queries, k, repeat):
+    """
+    Worker task: time the loading of an inverse file and the searches of the queries, without the query cache.
+    """
+    QueryPreprocessing.load_stop_list(common_words_path)
+    memory_before = resident_memory()
+    start = time.perf_counter()
+    inverse_file_reader = InverseFileReader(inverse_file_path, cache_size=0)
+    load_seconds = time.perf_counter() - start
+    memory_after = resident_memory()
+    # The boolean queries are the disjunctions of the words of the queries.
+    boolean_queries = [' | '.join(QueryPreprocessing.analyzer.query_tokens(query)) for query in queries]
+    searches = {
+        'matching_score': lambda query: inverse_file_reader.search_query_matching_score(query, k),
+        'boolean': lambda query: inverse_file_reader.search_query_boolean(query),
+    }
+    latencies = {}
+    for model in models:
+        if model in ProbabilisticScorer.models and inverse_file_reader.weights_type == 'f':
+            continue  # Of an inverse file of raw frequencies only.
+        search = searches.get(model, lambda query: inverse_file_reader.search_query_vector(query, model, k))
+        model_latencies = []
+        for query in boolean_queries if model == 'boolean' else queries:
+            if not query:
+                continue
+            for _ in range(repeat):
+                start = time.perf_counter()
+                search(query)
+                model_latencies.append(time.perf_counter() - start)
+        latencies[model] = latencies_summary(model_latencies)
+    return {
+        'load_seconds': load_seconds,
+        'load_memory_bytes': memory_after - memory_before if memory_after is not None else None,
+        'search_peak_memory_bytes': peak_memory(),
+        'k': k,
+        'queries': latencies,
+    }
+
+
+def run_isolated(function, *arguments):  # Run a function in a new process, see the module documentation.
+    with ProcessPoolExecutor(1, mp_context=get_context('spawn')) as pool:
+        return pool.submit(function, *arguments).result()
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=dirname(__file__) or '.', capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(arguments):
+    queries = list(TestCollection.read_queries(arguments.queries).values())
+    if arguments.synthetic:
+        model = CollectionModel(arguments.collection, arguments.queries, arguments.qrels)
+    results = []
+    with tempfile.TemporaryDirectory(dir=arguments.work_directory) as work_directory:
+        for scale in arguments.scales:
+            collection_path = arguments.collection
+            if arguments.synthetic:  # Scale n has n times as many documents as the real collection.
+                collection_path = join(work_directory, 'cacm{}.all'.format(scale))
+                queries_path = join(work_directory, 'query{}.text'.format(scale))
+                generator = CollectionGenerator(model, scale * len(model.profiles), seed=scale)
+                generator.write_collection(collection_path)
+                generator.write_queries(queries_path, join(work_directory, 'qrels{}.text'.format(scale)))
+                queries = list(TestCollection.read_queries(queries_path).values())
+            elif scale != 1:
+                collection_path = join(work_directory, 'cacm{}.all'.format(scale))
+                scale_collection(arguments.collection, collection_path, scale)
+            inverse_file_path = join(work_directory, 'inverse{}.bin'.format(scale))
+            tf_idf_file_path = join(work_directory, 'tfidf{}.bin'.format(scale))
+            result = {'scale': scale, 'synthetic': arguments.synthetic}
+            result.update(run_isolated(benchmark_build, collection_path, inverse_file_path, tf_idf_file_path,
+                                       arguments.common_words))
+            result['search'] = run_isolated(benchmark_search, inverse_file_path, arguments.common_words, queries,
+                                            arguments.k, arguments.repeat)
+            result['tf_idf_search'] = run_isolated(benchmark_search, tf_idf_file_path, arguments.common_words,
+                                                   queries, arguments.k, arguments.repeat)
+            results.append(result)
+            print('Scale {} done'.format(scale), file=sys.stderr)
+    return {
+        'commit': git_commit(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': cpu_count(),
+        'results': results,
+    }
+
+
+def flatten(values, prefix=''):  # Numeric leaves of nested dicts, by their dotted paths.
+    if isinstance(values, dict):
+        for name, value in values.items():
+            yield from flatten(value, '{}.{}'.format(prefix, name) if prefix else name)
+    elif isinstance(values, (int, float)) and not isinstance(values, bool):
+        yield prefix, values
+
+
+def compare(arguments):
+    """
+    Compare the results of two runs scale by scale, giving the ratio of each measure (after / before).
+    """
+    with open(arguments.before) as before_file, open(arguments.after) as after_file:
+        before, after = json.load(before_file), json.load(after_file)
+    before_results = {result['scale']: result for result in before['results']}
+    comparison = {'before': before['commit'], 'after': after['commit'], 'results': []}
+    for result in after['results']:
+        if result['scale'] not in before_results:
+            continue
+        before_measures = dict(flatten(before_results[result['scale']]))
+        comparison['results'].append({'scale': result['scale'], 'ratios': {
+            name: value / before_measures[name]
+            for name, value in flatten(result) if before_measures.get(name) and name != 'scale'
+        }})
+    return comparison
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='benchmark the collection at several scales')
+    run_parser.add_argument('--collection', default=cacm_all_default_path, help='CACM collection file')
+    run_parser.add_argument('--common-words', default=common_words_default_path, help='stop list file')
+    run_parser.add_argument('--queries', default=query_default_path, help='queries file')
+    run_parser.add_argument('--qrels', default=qrels_default_path, help='relevance judgments file')
+    run_parser.add_argument('--scales', type=int, nargs='+', default=[1, 10], help='sizes, in copies of the collection')
+    run_parser.add_argument('--synthetic', action='store_true',
+                            help='generate the collections and their queries (see synthetic.py) instead of copying')
+    run_parser.add_argument('-k', type=int, default=10, help='number of documents of the ranked searches')
+    run_parser.add_argument('--repeat', type=int, default=3, help='number of times each query is searched')
+    run_parser.add_argument('--work-directory', help='directory of the temporary files')
+    run_parser.add_argument('--output', help='JSON results file, the standard output by default')
+    run_parser.set_defaults(function=run)
+
+    compare_parser = subparsers.add_parser('compare', help='compare the results of two runs')
+    compare_parser.add_argument('before')
+    compare_parser.add_argument('after')
+    compare_parser.add_argument('--output', help='JSON comparison file, the standard output by default')
+    compare_parser.set_defaults(function=compare)
+
+    arguments = parser.parse_args(argv)
+    output = arguments.function(arguments)
+    if arguments.output:
+        with open(arguments.output, 'w') as output_file:
+            json.dump(output, output_file, indent=2)
+    else:
+        json.dump(output, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""
+Command line interface of the search engine: build, update, search and evaluate an inverse file, printing JSON.
+The search commands also accept the manifest of a sharded index (see shards.py).
+It only imports the core module, so it starts quickly and runs without Qt.
+"""
+import argparse
+import json
+import sys
+import time
+from os.path import join, dirname
+
+from benchmark import peak_memory
+from core import CACMParser, InverseFileWriter, TfIdfFileWriter, DocumentStore, DeltaSegment, InverseFileReader, \
+    ProbabilisticScorer, QueryPreprocessing
+from evaluation import TestCollection
+from shards import ShardedIndexWriter, ShardedInverseFileReader, open_index
+
+cacm_all_default_path = join(dirname(__file__), 'cacm', 'cacm.all')
+common_words_default_path = join(dirname(__file__), 'cacm', 'common_words')
+query_default_path = join(dirname(__file__), 'cacm', 'query.text')
+qrels_default_path = join(dirname(__file__), 'cacm', 'qrels.text')
+models = ('inner_product', 'dice', 'cos', 'jaccard')
+probabilistic_models = ProbabilisticScorer.models  # Of an inverse file of raw frequencies only.
+
+
+def build(arguments):
+    start = time.perf_counter()
+    output = {'inverse_file': arguments.inverse_file}
+    if arguments.shards:
+        writer = ShardedIndexWriter(arguments.collection, arguments.inverse_file, arguments.shards, arguments.tf_idf,
+                                    arguments.processes)
+        output['documents'] = writer.documents_count
+    elif arguments.tf_idf:
+        writer = TfIdfFileWriter(arguments.collection, arguments.inverse_file, arguments.processes,
+                                 arguments.compress_documents)
+        output['documents'] = writer.nember_docs
+    else:
+        writer = InverseFileWriter(CACMParser(arguments.collection), arguments.inverse_file, arguments.processes,
+                                   memory_budget=arguments.memory_budget,
+                                   compress_documents=arguments.compress_documents)
+        output['documents'] = writer.documents_count
+        output['runs'] = writer.runs_count  # Sorted runs spilled to disk, 0 for a build in memory.
+        output['estimated_peak_index_bytes'] = writer.peak_memory  # See InverseFileWriter.estimate_memory.
+    output['seconds'] = time.perf_counter() - start
+    output['peak_memory_bytes'] = peak_memory()  # Measured for this process, without its workers.
+    return output
+
+
+def update(arguments):
+    inverse_file_reader = InverseFileReader(arguments.inverse_file)
+    start = time.perf_counter()
+    if arguments.delete:
+        inverse_file_reader.delete_documents(arguments.delete)
+    documents = list(CACMParser(arguments.add)) if arguments.add else []
+    if documents:
+        inverse_file_reader.add_documents(documents)
+    merged_batches = inverse_file_reader.merge() if arguments.merge else 0
+    end = time.perf_counter()
+    return {'inverse_file': arguments.inverse_file, 'added': len(documents), 'deleted': len(arguments.delete),
+            'documents': inverse_file_reader.get_documents_count(), 'merged_batches': merged_batches,
+            'seconds': end - start}
+
+
+def merge(arguments):
+    start = time.perf_counter()
+    merged_batches = InverseFileReader(arguments.inverse_file).merge()
+    end = time.perf_counter()
+    return {'inverse_file': arguments.inverse_file, 'merged_batches': merged_batches, 'seconds': end - start}
+
+
+def search(arguments):
+    inverse_file_reader = open_index(arguments.inverse_file)
+    start = time.perf_counter()
+    if arguments.model == 'matching_score':
+        docs = inverse_file_reader.search_query_matching_score(arguments.query, arguments.k)
+    else:
+        docs = inverse_file_reader.search_query_vector(arguments.query, arguments.model, arguments.k)
+    end = time.perf_counter()
+    results = [{'document': doc_id, 'score': score} for doc_id, score in docs]
+    if arguments.titles:
+        add_titles(arguments.inverse_file, results)
+    return {'query': arguments.query, 'model': arguments.model, 'seconds': end - start, 'results': results}
+
+
+def boolean(arguments):
+    inverse_file_reader = open_index(arguments.inverse_file)
+    start = time.perf_counter()
+    docs = inverse_file_reader.search_query_boolean(arguments.query)
+    end = time.perf_counter()
+    results = [{'document': doc_id} for doc_id in docs]
+    if arguments.titles:
+        add_titles(arguments.inverse_file, results)
+    return {'query': arguments.query, 'seconds': end - start, 'results': results}
+
+
+def add_titles(inverse_file_path, results):
+    document_store = DocumentStore(DocumentStore.path_for(inverse_file_path),
+                                   log_path=DeltaSegment.path_for(inverse_file_path))
+    for result in results:
+        try:
+            result['title'] = document_store.get_document(result['document']).get_title()
+        except KeyError:  # The collection file changed since the inverse file was built.
+            result['title'] = None
+
+
+def evaluate(arguments):
+    inverse_file_reader = open_index(arguments.inverse_file, arguments.processes)
+    test_collection = TestCollection(arguments.queries, arguments.qrels)
+    if isinstance(inverse_file_reader, ShardedInverseFileReader):  # The shards are already searched in parallel.
+        return test_collection.evaluate(inverse_file_reader, arguments.models, arguments.depth)
+    return test_collection.evaluate(inverse_file_reader, arguments.models, arguments.depth, arguments.processes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--common-words', default=common_words_default_path, help='stop list file')
+    parser.add_argument('--k1', type=float, default=ProbabilisticScorer.k1, help='BM25 term frequency saturation')
+    parser.add_argument('--b', type=float, default=ProbabilisticScorer.b, help='BM25 length normalisation')
+    parser.add_argument('--mu', type=float, default=ProbabilisticScorer.mu, help='Dirichlet smoothing prior')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help='generate an inverse file')
+    build_parser.add_argument('inverse_file')
+    build_parser.add_argument('--collection', default=cacm_all_default_path, help='CACM collection file')
+    build_parser.add_argument('--tf-idf', action='store_true', help='weight the words by tf-idf')
+    build_parser.add_argument('--processes', type=int, default=1, help='worker processes, 0 for one per core')
+    build_parser.add_argument('--memory-budget', type=int, help='bytes of partial index kept in memory')
+    build_parser.add_argument('--compress-documents', action='store_true', help='store the compressed documents')
+    build_parser.add_argument('--shards', type=int,
+                              help='partition the documents into this many inverse files, named by the manifest path')
+    build_parser.set_defaults(function=build)
+
+    update_parser = subparsers.add_parser('update', help='add, replace or delete documents of a raw inverse file')
+    update_parser.add_argument('inverse_file')
+    update_parser.add_argument('--add', help='CACM file of the documents to add, replacing those with the same IDs')
+    update_parser.add_argument('--delete', type=int, nargs='+', default=[], help='IDs of the documents to delete')
+    update_parser.add_argument('--merge', action='store_true', help='merge the updates into the inverse file')
+    update_parser.set_defaults(function=update)
+
+    merge_parser = subparsers.add_parser('merge', help='merge the updates into the inverse file')
+    merge_parser.add_argument('inverse_file')
+    merge_parser.set_defaults(function=merge)
+
+    search_parser = subparsers.add_parser('search', help='ranked search')
+    search_parser.add_argument('inverse_file')
+    search_parser.add_argument('query')
+    search_parser.add_argument('--model', choices=models + probabilistic_models + ('matching_score',), default='cos')
+    search_parser.add_argument('-k', type=int, default=10, help='number of documents')
+    search_parser.add_argument('--titles', action='store_true', help='add the titles of the documents')
+    search_parser.set_defaults(function=search)
+
+    boolean_parser = subparsers.add_parser('boolean', help='boolean search')
+    boolean_parser.add_argument('inverse_file')
+    boolean_parser.add_argument('query', help="words with '&', '|', '~' and parentheses")
+    boolean_parser.add_argument('--titles', action='store_true', help='add the titles of the documents')
+    boolean_parser.set_defaults(function=boolean)
+
+    evaluate_parser = subparsers.add_parser('evaluate', help='ranked measures over the test queries')
+    evaluate_parser.add_argument('inverse_file')
+    evaluate_parser.add_argument('--queries', default=query_default_path, help='test queries file')
+    evaluate_parser.add_argument('--qrels', default=qrels_default_path, help='relevance judgments file')
+    evaluate_parser.add_argument('--models', nargs='+', choices=models + probabilistic_models, default=models)
+    evaluate_parser.add_argument('--depth', type=int, default=1000, help='documents retrieved for each query')
+    evaluate_parser.add_argument('--processes', type=int, default=1, help='worker processes, 0 for one per core')
+    evaluate_parser.set_defaults(function=evaluate)
+
+    arguments = parser.parse_args(argv)
+    if getattr(arguments, 'processes', 1) == 0:
+        arguments.processes = None
+    try:
+        QueryPreprocessing.load_stop_list(arguments.common_words)
+        ProbabilisticScorer.k1, ProbabilisticScorer.b, ProbabilisticScorer.mu = arguments.k1, arguments.b, arguments.mu
+        output = arguments.function(arguments)
+    except (ValueError, OSError) as err:
+        parser.exit(1, json.dumps({'error': str(err)}) + '\n')
+    json.dump(output, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1999 @@
+"""
+Search engine over the CACM collection: parsing, indexing and retrieval, without any GUI dependency.
+"""
+import sys
+import collections.abc
+import re
+import mmap
+import struct
+import pickle
+import heapq
+import threading
+import tempfile
+import zlib
+from array import array
+from bisect import bisect_left, insort
+from functools import lru_cache
+from collections import Counter
+from copy import copy
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import accumulate, chain, groupby, islice
+from math import log, log10
+from operator import itemgetter
+from os import cpu_count, getpid, remove, replace
+from os.path import join, abspath, isfile
+
+numpy = sparse = None  # Optional, imported by SparseScorer when first used as they are slow to import.
+
+class CACMDocument:
+    """
+    Represent a single CACM document with an ID, title and a summary.
+    """
+
+    def __init__(self, num, title, summary, offset=None, length=None):
+        self.I = num
+        self.T = title
+        self.W = summary
+        self.offset = offset
+        self.length = length
+
+    def __str__(self):
+        return str(self.I) + '/ ' + self.T + '\n' + self.W
+
+    def get_title(self):
+        return self.T
+
+    def get_document_number(self):
+        return self.I
+
+    def get_summary(self):
+        return self.W
+
+    def get_offset(self):  # Byte offset of the document's '.I' line in the collection file.
+        return self.offset
+
+    def get_length(self):  # Size in bytes of the document in the collection file.
+        return self.length
+
+
+class InverseFileFormat:
+    """
+    Versioned binary layout of an inverse file, designed to be memory-mapped.
+    A fixed header holding the offset of each section is followed by the postings, written first so that they can
+    be streamed, and the other sections, all aligned on 8 bytes (integers are little-endian):
+    - terms: the UTF-8 bytes of the sorted words, concatenated;
+    - term offsets: uint32 * (words + 1), position of each word in the terms section;
+    - postings offsets: uint64 * (words + 1), position of each posting list in the postings section;
+    - documents frequencies: uint32 * words, length of each posting list;
+    - postings: for each word, its document IDs delta and varint encoded, followed by its packed weights;
+    - statistics: float64 squared norms, uint32 lengths and uint32 unique terms counts, indexed by document ID;
+    - upper bounds: float64 * words for each of the maximum weight w, w / sqrt(squared norm) and
+      w / (1 + squared norm) of each word, bounding its contribution to the inner product, cos and dice scores;
+    - words statistics: float64 * words sum of the weights of each word, which is its collection frequency in an
+      inverse file of raw frequencies, and uint32 * words length of the shortest document containing it, bounding its
+      BM25 score (see ProbabilisticScorer).
+    Weights are packed as uint16 (or uint32 if needed) for raw frequencies and float32 otherwise.
+    """
+
+    magic = b'RIIF'
+    version = 3
+    header = struct.Struct('<4sHcxII8Q')
+
+    @staticmethod
+    def encode_doc_ids(doc_ids, buffer):
+        previous = 0
+        for doc_id in doc_ids:
+            delta = doc_id - previous
+            previous = doc_id
+            while delta >= 0x80:
+                buffer.append(delta & 0x7f | 0x80)
+                delta >>= 7
+            buffer.append(delta)
+
+    @staticmethod
+    def decode_doc_ids(data):
+        doc_ids = array('L')
+        doc_id = value = shift = 0
+        for byte in data:
+            value |= (byte & 0x7f) << shift
+            if byte & 0x80:
+                shift += 7
+            else:
+                doc_id += value
+                doc_ids.append(doc_id)
+                value = shift = 0
+        return doc_ids
+
+    @staticmethod
+    def integer_weights_type(max_weight):
+        return 'H' if max_weight <= 0xffff else 'I'
+
+    @staticmethod
+    def weights_type(words_documents_weights):
+        """
+        Choose the packed type of the weights: uint16 or uint32 for integers, float32 otherwise.
+        """
+        max_weight = 0
+        for docs_weights in words_documents_weights.values():
+            for weight in docs_weights.values():
+                if not isinstance(weight, int):
+                    return 'f'
+                max_weight = max(max_weight, weight)
+        return InverseFileFormat.integer_weights_type(max_weight)
+
+    @staticmethod
+    def write(path, words_documents_weights, documents_statistics):
+        """
+        Write an inverse file.
+        :param path: str representing the path of the inverse file.
+        :param words_documents_weights: dict of words mapped to dicts of document IDs and weights.
+        :param documents_statistics: dict of arrays as returned by InverseFileWriter.documents_statistics.
+        """
+        InverseFileFormat.write_sorted(
+            path,
+            ((word, words_documents_weights[word]) for word in sorted(words_documents_weights.keys())),
+            InverseFileFormat.weights_type(words_documents_weights),
+            documents_statistics
+        )
+
+    @staticmethod
+    def temporary_path(path):
+        """
+        Path of the temporary file a file is written to before replacing it, so that the readers which mapped the
+        previous file keep it (truncating a mapped file kills them) and an interrupted write leaves it whole.
+        """
+        return '{}.{}-{}.tmp'.format(path, getpid(), threading.get_ident())
+
+    @staticmethod
+    def write_section(file, data):
+        file.write(bytes(-file.tell() % 8))
+        offset = file.tell()
+        file.write(data)
+        return offset
+
+    @staticmethod
+    def write_sorted(path, words_documents_weights, weights_type, documents_statistics):
+        """
+        Write an inverse file from a stream of posting lists: only the term dictionary is kept in memory. The file is
+        written next to the path, then replaces the file at the path, see temporary_path.
+        :param path: str representing the path of the inverse file.
+        :param words_documents_weights: iterable of (word, dict of document IDs and weights), sorted by word.
+        :param weights_type: str array type code of the packed weights.
+        :param documents_statistics: dict of arrays as returned by InverseFileWriter.documents_statistics.
+        """
+        terms = bytearray()
+        term_offsets = array('I', [0])
+        postings_offsets = array('Q', [0])
+        documents_frequencies = array('I')
+        max_weights, max_cos_weights, max_dice_weights = array('d'), array('d'), array('d')
+        collection_frequencies, min_lengths = array('d'), array('I')
+        squared_norms = documents_statistics['squared_norms']
+        lengths = documents_statistics['lengths']
+        temporary_path = InverseFileFormat.temporary_path(path)
+        try:
+            with open(temporary_path, 'wb') as file:
+                file.write(bytes(InverseFileFormat.header.size))
+                postings_start = InverseFileFormat.write_section(file, b'')
+                for word, docs_weights in words_documents_weights:  # Code point order is also the UTF-8 bytes order.
+                    doc_ids = sorted(docs_weights.keys())
+                    weights = array(weights_type, (docs_weights[doc_id] for doc_id in doc_ids))
+                    postings = bytearray()
+                    InverseFileFormat.encode_doc_ids(doc_ids, postings)
+                    postings += weights.tobytes()
+                    file.write(postings)
+                    terms += word.encode()
+                    term_offsets.append(len(terms))
+                    postings_offsets.append(postings_offsets[-1] + len(postings))
+                    documents_frequencies.append(len(doc_ids))
+                    max_weights.append(max(weights))  # The bounds use the weights as packed, like the searches.
+                    max_cos_weights.append(max(
+                        weight / squared_norms[doc_id]**(1/2) for doc_id, weight in zip(doc_ids, weights)
+                    ))
+                    max_dice_weights.append(max(
+                        weight / (1 + squared_norms[doc_id]) for doc_id, weight in zip(doc_ids, weights)
+                    ))
+                    collection_frequencies.append(sum(weights))
+                    min_lengths.append(min(lengths[doc_id] for doc_id in doc_ids))
+                offsets = [InverseFileFormat.write_section(file, section) for section in (
+                    bytes(terms), term_offsets.tobytes(), postings_offsets.tobytes(), documents_frequencies.tobytes()
+                )]
+                offsets.append(postings_start)
+                offsets.append(InverseFileFormat.write_section(
+                    file,
+                    array('d', documents_statistics['squared_norms']).tobytes() +
+                    array('I', documents_statistics['lengths']).tobytes() +
+                    array('I', documents_statistics['unique_terms']).tobytes()
+                ))
+                offsets.append(InverseFileFormat.write_section(
+                    file, max_weights.tobytes() + max_cos_weights.tobytes() + max_dice_weights.tobytes()
+                ))
+                offsets.append(InverseFileFormat.write_section(
+                    file, collection_frequencies.tobytes() + min_lengths.tobytes()
+                ))
+                file.seek(0)
+                file.write(InverseFileFormat.header.pack(
+                    InverseFileFormat.magic, InverseFileFormat.version, weights_type.encode(),
+                    len(documents_frequencies), len(documents_statistics['squared_norms']), *offsets
+                ))
+            replace(temporary_path, path)
+        except BaseException:
+            if isfile(temporary_path):
+                remove(temporary_path)
+            raise
+        if isfile(DeltaSegment.path_for(path)):  # The updates of a previous file do not apply to this one.
+            remove(DeltaSegment.path_for(path))
+
+
+class InverseFileWriter:
+    """
+    Writer for a binary inverse file of raw frequencies.
+    """
+
+    word_memory = 300  # Estimated bytes used by a word, and by one of its postings, in a partial index.
+    posting_memory = 30
+
+    def __init__(self, cacm, inverse_file_name, processes=1, chunk_size=500, memory_budget=None,
+                 documents_store_path=None, compress_documents=False):
+        """
+        Generate an inverse file from a CACM reader.
+        :param cacm: CACMParser instance.
+        :param inverse_file_name: str representing the path of the inverse file.
+        :param processes: int number of worker processes, None for one per core. With more than one process, chunks
+        of documents are indexed in parallel into sorted runs which are then merged; the file is identical.
+        :param chunk_size: int number of documents sent to a worker at a time.
+        :param memory_budget: int number of bytes, for a serial build of a collection larger than memory: the partial
+        index is spilled to a sorted run whenever its estimated size reaches the budget, and the runs are merged.
+        :param documents_store_path: str representing the path of the DocumentStore built along, by default next to
+        the inverse file; "" for none.
+        :param compress_documents: bool, keep the compressed titles and summaries in the document store.
+        """
+        self.inv_filename = inverse_file_name
+        self.runs_count = 0  # Number of sorted runs written to disk.
+        self.peak_memory = 0  # Estimated peak size in bytes of the in-memory (partial) index.
+        if documents_store_path is None:
+            documents_store_path = DocumentStore.path_for(self.inv_filename) if self.inv_filename != "" else ""
+        documents_store = None
+        if documents_store_path != "":
+            documents_store = DocumentStoreWriter(documents_store_path, cacm.filepath, compress_documents)
+            cacm = documents_store.recording(cacm)
+        try:
+            if processes == 1 and memory_budget is None:
+                self.build_in_memory(cacm)
+            else:
+                self.build_from_runs(cacm, processes, chunk_size, memory_budget)
+        except BaseException:
+            if documents_store is not None:
+                documents_store.abort()
+            raise
+        if documents_store is not None:
+            documents_store.close()
+
+    def build_in_memory(self, cacm):
+        words_documents_frequencies, self.documents_count = self.index_documents(cacm)
+        self.peak_memory = self.estimate_memory(words_documents_frequencies)
+        if self.inv_filename !="" :
+            InverseFileFormat.write(
+                self.inv_filename, words_documents_frequencies, self.documents_statistics(words_documents_frequencies)
+            )
+        else:
+            self.to_return_inv_file = words_documents_frequencies
+
+    def build_from_runs(self, cacm, processes, chunk_size, memory_budget):
+        with tempfile.TemporaryDirectory() as runs_directory:
+            self.runs_statistics = {'squared_norms': array('d'), 'lengths': array('L'), 'unique_terms': array('L')}
+            if processes == 1:
+                runs_paths, max_frequency = self.index_documents_spimi(cacm, memory_budget, runs_directory)
+            else:
+                runs_paths, max_frequency = self.index_documents_parallel(cacm, processes, chunk_size, runs_directory)
+            self.runs_count = len(runs_paths)
+            words_documents_frequencies = self.merge_runs(runs_paths)
+            if self.inv_filename !="" :
+                InverseFileFormat.write_sorted(
+                    self.inv_filename, words_documents_frequencies,
+                    InverseFileFormat.integer_weights_type(max_frequency), self.runs_statistics
+                )
+            else:
+                self.to_return_inv_file = dict(words_documents_frequencies)
+
+    @staticmethod
+    def estimate_memory(words_documents_frequencies, postings_count=None):
+        if postings_count is None:
+            postings_count = sum(len(docs_frequencies) for docs_frequencies in words_documents_frequencies.values())
+        return (len(words_documents_frequencies) * InverseFileWriter.word_memory +
+                postings_count * InverseFileWriter.posting_memory)
+
+    @staticmethod
+    def add_document(words_documents_frequencies, document):
+        """
+        Add the words of a document to a (partial) index.
+        :param words_documents_frequencies: dict of words mapped to dicts of document IDs and frequencies.
+        :param document: CACMDocument.
+        :return: int number of postings added.
+        """
+        added = 0
+        doc_id = document.get_document_number()
+        for word, frequency in InverseFileWriter.document_frequencies(document).items():
+            docs_frequencies = words_documents_frequencies.setdefault(word, {})
+            if doc_id in docs_frequencies:
+                docs_frequencies[doc_id] += frequency
+            else:
+                docs_frequencies[doc_id] = frequency
+                added += 1
+        return added
+
+    @staticmethod
+    def index_documents(documents):
+        """
+        Count the words of some documents.
+        :param documents: iterable of CACMDocument.
+        :return: tuple of the dict of words mapped to dicts of document IDs and frequencies, and the documents count.
+        """
+        words_documents_frequencies = {}
+        documents_count = 0
+        for document in documents:
+            documents_count += 1
+            InverseFileWriter.add_document(words_documents_frequencies, document)
+        return words_documents_frequencies, documents_count
+
+    def index_documents_spimi(self, cacm, memory_budget, runs_directory):
+        """
+        Single-pass in-memory indexing: spill the partial index to a sorted run each time the budget is reached.
+        :return: tuple of the list of the runs paths, in document order, and the maximum frequency.
+        """
+        runs_paths = []
+        max_frequency = 0
+        words_documents_frequencies = {}
+        postings_count = 0
+        self.documents_count = 0
+        for document in cacm:
+            self.documents_count += 1
+            postings_count += self.add_document(words_documents_frequencies, document)
+            memory = self.estimate_memory(words_documents_frequencies, postings_count)
+            self.peak_memory = max(self.peak_memory, memory)
+            if memory >= memory_budget:
+                runs_paths.append(join(runs_directory, '{}.run'.format(len(runs_paths))))
+                max_frequency = max(max_frequency, self.write_run(words_documents_frequencies, runs_paths[-1]))
+                self.add_documents_statistics(self.partial_documents_statistics(words_documents_frequencies))
+                words_documents_frequencies = {}
+                postings_count = 0
+        if words_documents_frequencies:
+            runs_paths.append(join(runs_directory, '{}.run'.format(len(runs_paths))))
+            max_frequency = max(max_frequency, self.write_run(words_documents_frequencies, runs_paths[-1]))
+            self.add_documents_statistics(self.partial_documents_statistics(words_documents_frequencies))
+        return runs_paths, max_frequency
+
+    def index_documents_parallel(self, cacm, processes, chunk_size, runs_directory):
+        """
+        Index chunks of documents in a process pool, each worker writing a sorted run.
+        :return: tuple of the list of the runs paths, in document order, and the maximum frequency.
+        """
+        workers = processes or cpu_count()
+        with ProcessPoolExecutor(workers) as pool:
+            runs_paths = []
+            futures = []
+            pending = set()
+            for chunk in iter(lambda: list(islice(cacm, chunk_size)), []):
+                if len(pending) >= 2 * workers:  # Bound the number of chunks waiting in memory.
+                    pending = wait(pending, return_when=FIRST_COMPLETED).not_done
+                runs_paths.append(join(runs_directory, '{}.run'.format(len(runs_paths))))
+                futures.append(pool.submit(
+                    InverseFileWriter.index_chunk, chunk, runs_paths[-1], QueryPreprocessing.stop_list
+                ))
+                pending.add(futures[-1])
+            results = [future.result() for future in futures]
+        for _, _, _, partial_documents_statistics in results:
+            self.add_documents_statistics(partial_documents_statistics)
+        self.documents_count = sum(documents_count for documents_count, _, _, _ in results)
+        self.peak_memory = max((memory for _, _, memory, _ in results), default=0)
+        return runs_paths, max((max_frequency for _, max_frequency, _, _ in results), default=0)
+
+    @staticmethod
+    def index_chunk(documents, run_path, stop_list):
+        """
+        Worker task: index a chunk of documents into a sorted run file.
+        :return: tuple of the number of documents in the chunk, their maximum frequency, the estimated memory used and
+        their statistics.
+        """
+        QueryPreprocessing.set_stop_list(stop_list)
+        words_documents_frequencies, documents_count = InverseFileWriter.index_documents(documents)
+        max_frequency = InverseFileWriter.write_run(words_documents_frequencies, run_path)
+        return (documents_count, max_frequency, InverseFileWriter.estimate_memory(words_documents_frequencies),
+                InverseFileWriter.partial_documents_statistics(words_documents_frequencies))
+
+    @staticmethod
+    def write_run(words_documents_frequencies, run_path):
+        """
+        Write a partial index as a run: a sequence of pickled (word, {doc_id: frequency}) entries sorted by word.
+        :return: int maximum frequency in the partial index.
+        """
+        max_frequency = 0
+        with open(run_path, 'wb') as run:
+            for word in sorted(words_documents_frequencies.keys()):
+                pickle.dump((word, words_documents_frequencies[word]), run, pickle.HIGHEST_PROTOCOL)
+                max_frequency = max(max_frequency, max(words_documents_frequencies[word].values()))
+        return max_frequency
+
+    @staticmethod
+    def read_run(run_path):
+        with open(run_path, 'rb') as run:
+            while True:
+                try:
+                    yield pickle.load(run)
+                except EOFError:
+                    return
+
+    @staticmethod
+    def merge_runs(runs_paths):
+        """
+        K-way merge of sorted runs, the runs being given in document order.
+        :return: generator of (word, {doc_id: frequency}) in word order.
+        """
+        entries = heapq.merge(*(InverseFileWriter.read_run(path) for path in runs_paths), key=itemgetter(0))
+        for word, word_entries in groupby(entries, key=itemgetter(0)):
+            docs_frequencies = {}
+            for _, run_docs_frequencies in word_entries:
+                for doc_id, frequency in run_docs_frequencies.items():
+                    docs_frequencies[doc_id] = docs_frequencies.get(doc_id, 0) + frequency
+            yield word, docs_frequencies
+
+    def get_InverseFile(self):
+        return self.to_return_inv_file
+
+    @staticmethod
+    def documents_statistics(words_documents_frequencies, words_documents_weights=None):
+        """
+        Compute the per-document statistics stored after the postings in the inverse file.
+        :param words_documents_frequencies: dict of words mapped to dicts of document IDs and raw frequencies.
+        :param words_documents_weights: same structure holding the stored weights, when they differ from the frequencies.
+        :return: dict of arrays indexed by document ID: 'squared_norms' of the weights, 'lengths' in tokens and
+        'unique_terms' counts.
+        """
+        if words_documents_weights is None:
+            words_documents_weights = words_documents_frequencies
+        max_doc_id = max((doc_id for docs in words_documents_frequencies.values() for doc_id in docs), default=0)
+        squared_norms = array('d', [0.0]) * (max_doc_id + 1)
+        lengths = array('L', [0]) * (max_doc_id + 1)
+        unique_terms = array('L', [0]) * (max_doc_id + 1)
+        for word in sorted(words_documents_weights.keys()):  # Fixed order: the sums do not depend on how it was built.
+            for doc_id, weight in words_documents_weights[word].items():
+                squared_norms[doc_id] += weight**2
+                lengths[doc_id] += int(words_documents_frequencies[word][doc_id])
+                unique_terms[doc_id] += 1
+        return {'squared_norms': squared_norms, 'lengths': lengths, 'unique_terms': unique_terms}
+
+    @staticmethod
+    def partial_documents_statistics(words_documents_frequencies):
+        """
+        Compute the statistics of the documents of a partial index, summed in the same order as documents_statistics.
+        :return: dict of document IDs mapped to lists of their squared norm, length and unique terms count.
+        """
+        partial_statistics = {}
+        for word in sorted(words_documents_frequencies.keys()):
+            for doc_id, frequency in words_documents_frequencies[word].items():
+                document_statistics = partial_statistics.setdefault(doc_id, [0.0, 0, 0])
+                document_statistics[0] += frequency**2
+                document_statistics[1] += frequency
+                document_statistics[2] += 1
+        return partial_statistics
+
+    def add_documents_statistics(self, partial_statistics):
+        squared_norms = self.runs_statistics['squared_norms']
+        lengths = self.runs_statistics['lengths']
+        unique_terms = self.runs_statistics['unique_terms']
+        missing = max(partial_statistics.keys(), default=-1) + 1 - len(squared_norms)
+        if missing > 0:
+            squared_norms.extend([0.0] * missing)
+            lengths.extend([0] * missing)
+            unique_terms.extend([0] * missing)
+        for doc_id, (squared_norm, length, unique_terms_count) in partial_statistics.items():
+            squared_norms[doc_id] += squared_norm
+            lengths[doc_id] += length
+            unique_terms[doc_id] += unique_terms_count
+
+    @staticmethod
+    def document_frequencies(cacmElem):
+        analyzer = QueryPreprocessing.analyzer
+        return Counter(analyzer.tokens(cacmElem.get_title()) + analyzer.tokens(cacmElem.get_summary()))
+
+
+class TfIdfFileWriter:
+    """
+    Writer for a binary inverse file of tf-idf weights.
+    """
+
+    def __init__(self, cacm, TfIdf_name, processes=1, compress_documents=False):
+        """
+        Generate a tf-idf inverse file in a single pass over the collection.
+        :param cacm: str representing the path of the CACM collection file, or CACMParser instance.
+        :param TfIdf_name: str representing the path of the inverse file.
+        :param processes: int number of worker processes used to count the words, see InverseFileWriter.
+        :param compress_documents: bool, see InverseFileWriter.
+        """
+        if isinstance(cacm, str):
+            cacm = CACMParser(cacm)
+        # The document store is kept only once the inverse file is written, see InverseFileWriter.
+        documents_store = DocumentStoreWriter(DocumentStore.path_for(TfIdf_name), cacm.filepath, compress_documents)
+        try:
+            frequencies_writer = InverseFileWriter(documents_store.recording(cacm), "", processes,
+                                                   documents_store_path="")
+            self.docs_words_frequencies = frequencies_writer.get_InverseFile()
+            self.nember_docs = frequencies_writer.documents_count
+            self.Idf_filename = TfIdf_name
+            d = {}
+            for term, docs_frequencies in self.docs_words_frequencies.items():
+                max_frequency = max(docs_frequencies.values())
+                idf = log10(self.nember_docs/len(docs_frequencies)+1)
+                d[term] = {doc: frequency/max_frequency * idf for doc, frequency in docs_frequencies.items()}
+            InverseFileFormat.write(
+                self.Idf_filename, d, InverseFileWriter.documents_statistics(self.docs_words_frequencies, d)
+            )
+        except BaseException:
+            documents_store.abort()
+            raise
+        documents_store.close()
+
+
+class CACMParser(collections.abc.Iterator):
+    """
+    Iterator which returns a CACMDocument on each call.
+    The collection file is memory-mapped and scanned one document at a time, so memory does not depend on its
+    size, and each document records its byte offset so that parsing can be resumed from it.
+    """
+
+    section_regexp = re.compile(r'^(\.[A-Z])[ \t\r]*$', re.MULTILINE)
+
+    def __init__(self, filepath, offset=0, select=None):
+        """
+        Open a CACM collection file.
+        :param filepath: str representing the path of the collection file.
+        :param offset: int byte offset of the '.I' line of the first document to parse.
+        :param select: function of a document ID telling whether to return the document, which is otherwise skipped
+        without being parsed; all the documents are returned by default.
+        """
+        self.filepath = filepath
+        self.select = select
+        with open(filepath, 'rb') as f:
+            try:
+                self.mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # Empty file.
+                self.mapping = b''
+        if self.mapping[offset:offset + 2] == b'.I':
+            self.position = offset
+        else:  # Skip anything before the next document.
+            self.position = self.mapping.find(b'\n.I', offset) + 1 or len(self.mapping)
+
+    def __next__(self):
+        while self.position < len(self.mapping):
+            offset = self.position
+            self.position = self.mapping.find(b'\n.I', offset) + 1 or len(self.mapping)
+            if self.select is None or self.select(int(self.mapping[offset + 2:self.mapping.find(b'\n', offset)])):
+                return CACMParser.parse_document(self.mapping[offset:self.position], offset)
+        raise StopIteration
+
+    def __iter__(self):
+        return self
+
+    @staticmethod
+    def parse_document(data, offset=None):
+        """
+        Parse the text of a single document, from its '.I' line to the next one.
+        :param data: bytes of the document.
+        :param offset: int byte offset of the document in the collection file.
+        :return: CACMDocument.
+        """
+        parts = re.split(CACMParser.section_regexp, data.decode())
+        I = int(parts[0][2:])
+        sections = {}
+        for marker, text in zip(parts[1::2], parts[2::2]):
+            if marker == '.B':  # Only the title and the summary, which come before '.B', are kept.
+                break
+            sections[marker] = text
+        T = sections.get('.T', '').strip(' \n').replace('\n', ' ')
+        W = sections.get('.W', '').strip(' \n').replace('\n', ' ')
+        return CACMDocument(I, T, W, offset, len(data))
+
+
+class DocumentStore:
+    """
+    Random access to the documents of a collection, stored next to its inverse file.
+    The store maps each document ID to the byte range of the document in the collection file or, when compressed,
+    to its zlib compressed title and summary kept in the store itself. Recently fetched documents are cached.
+    The documents added, replaced or deleted by the delta segment of the inverse file are taken from its log, where
+    the updates keep the compressed titles and summaries, until merge rewrites the store.
+    Layout: a header, the collection path (UTF-8), the compressed documents if any, then the uint64 offsets and
+    uint32 lengths indexed by document ID (a length of 0 meaning no document).
+    """
+
+    magic = b'RIDS'
+    version = 1
+    header = struct.Struct('<4sHBxIIQ')
+
+    def __init__(self, filepath, cache_size=64, log_path=None):
+        """
+        Open a document store.
+        :param filepath: str representing the path of the document store.
+        :param cache_size: int number of recently fetched documents kept in memory.
+        :param log_path: str representing the path of the log of the delta segment of the inverse file, None for none.
+        :raise ValueError: if the file is not a supported document store, or the log not a supported log.
+        """
+        self.filepath = filepath
+        with open(filepath, 'rb') as store_file:
+            header = store_file.read(DocumentStore.header.size)
+            if len(header) < DocumentStore.header.size:
+                raise ValueError('{} is not a document store'.format(filepath))
+            magic, version, self.compressed, documents_size, path_length, table_offset = \
+                DocumentStore.header.unpack(header)
+            if magic != DocumentStore.magic:
+                raise ValueError('{} is not a document store'.format(filepath))
+            if version != DocumentStore.version:
+                raise ValueError('Unsupported document store version {}'.format(version))
+            self.collection_path = store_file.read(path_length).decode()
+            store_file.seek(table_offset)
+            self.offsets = array('Q')
+            self.offsets.fromfile(store_file, documents_size)
+            self.lengths = array('I')
+            self.lengths.fromfile(store_file, documents_size)
+        with open(filepath if self.compressed else self.collection_path, 'rb') as source_file:
+            self.mapping = mmap.mmap(source_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.updated = {}  # Document ID -> compressed title and summary from the log, None for an unknown document.
+        if log_path is not None and isfile(log_path):
+            for deleted_ids, added_documents, added_texts in DeltaSegment.read_batches(log_path)[0]:
+                self.updated.update(dict.fromkeys(deleted_ids))
+                self.updated.update((doc_id, added_texts.get(doc_id)) for doc_id in added_documents)
+        self.get_document = lru_cache(cache_size)(self.read_document)
+
+    @staticmethod
+    def path_for(inverse_file_path):
+        return inverse_file_path + '.docs'
+
+    @staticmethod
+    def compress(document):  # Title and summary of a document as kept in a compressed store.
+        return zlib.compress((document.get_title() + '\n' + document.get_summary()).encode())
+
+    @staticmethod
+    def decompress(document_id, data):
+        title, summary = zlib.decompress(data).decode().split('\n', 1)
+        return CACMDocument(document_id, title, summary)
+
+    def read_document(self, document_id):
+        """
+        Fetch a document with a single seek. Use get_document, which is the cached version of this method.
+        :param document_id: int representing ID of the document.
+        :return: CACMDocument.
+        :raise KeyError: if the document is not in the store, or the collection file changed since it was built.
+        """
+        if document_id in self.updated:
+            if self.updated[document_id] is None:
+                raise KeyError(document_id)
+            return DocumentStore.decompress(document_id, self.updated[document_id])
+        if not 0 <= document_id < len(self.lengths) or not self.lengths[document_id]:
+            raise KeyError(document_id)
+        end = self.offsets[document_id] + self.lengths[document_id]
+        if end > len(self.mapping):
+            raise KeyError(document_id)
+        data = self.mapping[self.offsets[document_id]:end]
+        try:
+            if self.compressed:
+                return DocumentStore.decompress(document_id, data)
+            document = CACMParser.parse_document(data, self.offsets[document_id])
+        except (ValueError, zlib.error) as err:  # UnicodeDecodeError is a ValueError.
+            raise KeyError(document_id) from err
+        if document.get_document_number() != document_id:
+            raise KeyError(document_id)
+        return document
+
+    def merge(self):
+        """
+        Rewrite the store with the documents of the log, see InverseFileReader.merge. The added documents being in no
+        file, a store referring to the collection file is written compressed if there are any.
+        """
+        compressed = self.compressed or any(data is not None for data in self.updated.values())
+        documents_store = DocumentStoreWriter(self.filepath, self.collection_path, compressed)
+        try:
+            for doc_id in sorted(set(chain(
+                    (doc_id for doc_id, length in enumerate(self.lengths) if length), self.updated
+            ))):
+                try:
+                    documents_store.add(self.read_document(doc_id))
+                except KeyError:  # Deleted, or no longer in the collection file.
+                    pass
+        except BaseException:
+            documents_store.abort()
+            raise
+        documents_store.close()
+
+
+class DocumentStoreWriter:
+    """
+    Writer for a DocumentStore, fed with the documents while an inverse file is built.
+    """
+
+    def __init__(self, filepath, collection_path, compressed=False):
+        """
+        :param filepath: str representing the path of the document store.
+        :param collection_path: str representing the path of the collection file the documents come from.
+        :param compressed: bool, store the compressed title and summary instead of referring to the collection file.
+        """
+        self.filepath = filepath
+        self.temporary_path = InverseFileFormat.temporary_path(filepath)  # Replaces the store once closed.
+        self.file = open(self.temporary_path, 'wb')
+        self.compressed = compressed
+        self.collection_path = abspath(collection_path).encode()
+        self.file.write(bytes(DocumentStore.header.size))
+        self.file.write(self.collection_path)
+        self.offsets = array('Q')
+        self.lengths = array('I')
+
+    def add(self, document):
+        doc_id = document.get_document_number()
+        if doc_id >= len(self.offsets):
+            self.offsets.extend([0] * (doc_id + 1 - len(self.offsets)))
+            self.lengths.extend([0] * (doc_id + 1 - len(self.lengths)))
+        if self.compressed:
+            data = DocumentStore.compress(document)
+            self.offsets[doc_id] = self.file.tell()
+            self.lengths[doc_id] = len(data)
+            self.file.write(data)
+        else:
+            self.offsets[doc_id] = document.get_offset()
+            self.lengths[doc_id] = document.get_length()
+
+    def recording(self, documents):
+        """
+        Generator adding the documents to the store as they go through.
+        """
+        for document in documents:
+            self.add(document)
+            yield document
+
+    def close(self):
+        table_offset = self.file.tell()
+        self.offsets.tofile(self.file)
+        self.lengths.tofile(self.file)
+        self.file.seek(0)
+        self.file.write(DocumentStore.header.pack(
+            DocumentStore.magic, DocumentStore.version, self.compressed, len(self.offsets),
+            len(self.collection_path), table_offset
+        ))
+        self.file.close()
+        replace(self.temporary_path, self.filepath)
+
+    def abort(self):  # Remove the unfinished store, leaving the previous one in place.
+        self.file.close()
+        remove(self.temporary_path)
+
+
+class SegmentView:
+    """
+    Read-only sequence of the values of an array of the inverse file, some of which are replaced or appended by its
+    delta segment. Items beyond both are 0.
+    """
+
+    def __init__(self, base, overrides):
+        """
+        :param base: memoryview of the inverse file.
+        :param overrides: dict of indexes and their values.
+        """
+        self.base = base
+        self.overrides = overrides
+
+    def __getitem__(self, index):
+        value = self.overrides.get(index)
+        if value is not None:
+            return value
+        return self.base[index] if index < len(self.base) else 0
+
+    def __len__(self):
+        return max(len(self.base), max(self.overrides, default=-1) + 1)
+
+    def __iter__(self):
+        return (self[index] for index in range(len(self)))
+
+
+class MergedDocumentsFrequencies:
+    """
+    Read-only sequence of the documents frequencies of the words of an inverse file with a delta segment, which are
+    counted on the merged posting lists when documents of the file were deleted.
+    """
+
+    def __init__(self, inverse_file_reader):
+        self.reader = inverse_file_reader
+
+    def __getitem__(self, index):
+        reader = self.reader
+        if reader.delta.deleted_count:
+            return len(reader.decode_postings(index)[0])
+        word = reader.get_word(index).decode()
+        return ((reader.main_documents_frequencies[index] if index < reader.words_count else 0) +
+                len(reader.delta.postings.get(word, ())))
+
+    def __len__(self):
+        return self.reader.get_words_count()
+
+
+class MergedCollectionFrequencies(MergedDocumentsFrequencies):
+    """
+    Read-only sequence of the collection frequencies of the words of an inverse file of raw frequencies with a delta
+    segment, which are summed on the merged posting lists when documents of the file were deleted.
+    """
+
+    def __getitem__(self, index):
+        reader = self.reader
+        if reader.delta.deleted_count:
+            return float(sum(reader.decode_postings(index)[1]))
+        word = reader.get_word(index).decode()
+        return ((reader.main_collection_frequencies[index] if index < reader.words_count else 0.0) +
+                sum(reader.delta.postings.get(word, {}).values()))
+
+
+class DeltaSegment:
+    """
+    Updates of an inverse file of raw frequencies since it was built, kept apart from it until they are merged.
+    The updates are appended, a batch at a time, to a log next to the inverse file, and replayed in memory by the
+    readers: the documents added (or replaced) are indexed here, and the documents of the inverse file which were
+    deleted (or replaced) are marked in a bitmap.
+    Log: a header (magic, version) followed by the batches, each a record of its uint32 length and CRC-32 and of the
+    pickled (list of deleted document IDs, dict of added document IDs mapped to dicts of their words and frequencies,
+    dict of added document IDs mapped to their compressed titles and summaries for the DocumentStore).
+    A batch being appended, or left incomplete by an interrupted update, fails its check and ends the log for the
+    readers, which never change the file: only an update cuts it off, before appending its own batch.
+    """
+
+    magic = b'RIDL'
+    version = 1
+    header = struct.Struct('<4sH')
+    record_header = struct.Struct('<II')
+
+    def __init__(self, main_documents_size):
+        """
+        :param main_documents_size: int size of the statistics arrays of the inverse file.
+        """
+        self.deleted = bytearray((main_documents_size + 7) // 8)  # Bitmap of the deleted documents of the file.
+        self.deleted_count = 0
+        self.documents = {}  # Document ID -> dict of words and frequencies, for the added documents.
+        self.postings = {}  # Word -> dict of added document IDs and frequencies.
+        self.words = []  # Added words which are not in the inverse file, indexed after its words.
+        self.words_indexes = {}  # Word of self.words -> its index.
+        self.batches_count = 0
+        # Overrides of the arrays of the inverse file, see SegmentView: statistics of the added documents, and upper
+        # bounds and minimum lengths of the words having added documents.
+        self.squared_norms, self.lengths, self.unique_terms = {}, {}, {}
+        self.max_weights, self.max_cos_weights, self.max_dice_weights, self.min_lengths = {}, {}, {}, {}
+
+    @staticmethod
+    def path_for(inverse_file_path):
+        return inverse_file_path + '.delta'
+
+    def is_deleted(self, doc_id):
+        return self.deleted[doc_id >> 3] >> (doc_id & 7) & 1
+
+    def delete(self, doc_id):
+        self.deleted[doc_id >> 3] |= 1 << (doc_id & 7)
+        self.deleted_count += 1
+
+    @staticmethod
+    def append_batch(path, deleted_ids, added_documents, added_texts):
+        """
+        Append a batch to a log, created if needed, in a single write.
+        :return: int size of the log.
+        """
+        data = pickle.dumps((deleted_ids, added_documents, added_texts), pickle.HIGHEST_PROTOCOL)
+        record = DeltaSegment.record_header.pack(len(data), zlib.crc32(data)) + data
+        with open(path, 'ab') as log:
+            if not log.tell():
+                record = DeltaSegment.header.pack(DeltaSegment.magic, DeltaSegment.version) + record
+            log.write(record)
+            return log.tell()
+
+    @staticmethod
+    def read_batches(path, start=0):
+        """
+        Read the complete batches of a log, without changing it.
+        :param start: int offset of a batch to start from, 0 for the whole log.
+        :return: tuple of the list of (deleted document IDs, added documents, added texts) batches, and the int
+        offset of the end of the last complete batch.
+        :raise ValueError: if the file is not a supported log.
+        """
+        with open(path, 'rb') as log:
+            log.seek(start)
+            data = log.read()
+        end = 0
+        if not start:
+            if len(data) < DeltaSegment.header.size:  # Empty, or interrupted while creating it.
+                return [], 0
+            magic, version = DeltaSegment.header.unpack_from(data)
+            if magic != DeltaSegment.magic:
+                raise ValueError('{} is not a delta segment log'.format(path))
+            if version != DeltaSegment.version:
+                raise ValueError('Unsupported delta segment log version {}'.format(version))
+            end = DeltaSegment.header.size
+        batches = []
+        while end + DeltaSegment.record_header.size <= len(data):
+            length, checksum = DeltaSegment.record_header.unpack_from(data, end)
+            record = data[end + DeltaSegment.record_header.size:end + DeltaSegment.record_header.size + length]
+            if len(record) < length or zlib.crc32(record) != checksum:
+                break
+            batches.append(pickle.loads(record))
+            end += DeltaSegment.record_header.size + length
+        return batches, start + end
+
+    @staticmethod
+    def repair(path, start=0):
+        """
+        Cut an incomplete batch off the end of a log. Only for the writer of the log, as it could be appending one.
+        :param start: int offset of the end of a complete batch, from which the log is checked.
+        :return: int size of the log.
+        """
+        if not isfile(path):
+            return 0
+        with open(path, 'r+b') as log:
+            size = log.seek(0, 2)
+            if size < start:  # Not the log the offset comes from.
+                start = 0
+            if size > start:
+                end = DeltaSegment.read_batches(path, start)[1]
+                if end < size:
+                    log.truncate(end)
+                    size = end
+            return size
+
+
+class InverseFileReader:
+    """
+    Memory-mapped reader for a binary inverse file, with the updates of its delta segment if it has one.
+    """
+
+    exhaustive_ratio = 16  # search_top_k scores every candidate of a probabilistic model when there are at most 16k.
+    vector_models = ('inner_product', 'dice', 'cos', 'jaccard')
+
+    def __init__(self, filepath, cache_size=256):
+        """
+        Map the inverse file in memory. Only the header is read: the posting lists are decoded when a query needs
+        them, and the mapped pages can be shared between processes reading the same file.
+        :param filepath: str representing the path of the inverse file.
+        :param cache_size: int number of recent query results kept in memory.
+        :raise ValueError: if the file is not a supported inverse file.
+        """
+        self.filepath = filepath
+        with open(filepath, 'rb') as inv_file:
+            self.mapping = mmap.mmap(inv_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.mapping) < InverseFileFormat.header.size:
+            raise ValueError('{} is not an inverse file'.format(filepath))
+        (magic, version, weights_type, self.words_count, documents_size, self.terms_start, term_offsets_start,
+         postings_offsets_start, documents_frequencies_start, self.postings_start, statistics_start, upper_bounds_start,
+         words_statistics_start) = InverseFileFormat.header.unpack_from(self.mapping)
+        if magic != InverseFileFormat.magic:
+            raise ValueError('{} is not an inverse file'.format(filepath))
+        if version != InverseFileFormat.version:
+            raise ValueError('Unsupported inverse file version {}'.format(version))
+        self.weights_type = weights_type.decode()
+        view = memoryview(self.mapping)
+        self.term_offsets = view[term_offsets_start:term_offsets_start + 4 * (self.words_count + 1)].cast('I')
+        self.postings_offsets = view[postings_offsets_start:postings_offsets_start + 8 * (self.words_count + 1)].cast('Q')
+        self.documents_frequencies = view[documents_frequencies_start:documents_frequencies_start + 4 * self.words_count].cast('I')
+        self.main_documents_frequencies = self.documents_frequencies  # Lengths of the posting lists of the file.
+        self.documents_squared_norms = view[statistics_start:statistics_start + 8 * documents_size].cast('d')
+        statistics_start += 8 * documents_size
+        self.documents_lengths = view[statistics_start:statistics_start + 4 * documents_size].cast('I')
+        statistics_start += 4 * documents_size
+        self.documents_unique_terms = view[statistics_start:statistics_start + 4 * documents_size].cast('I')
+        self.max_weights = view[upper_bounds_start:upper_bounds_start + 8 * self.words_count].cast('d')
+        upper_bounds_start += 8 * self.words_count
+        self.max_cos_weights = view[upper_bounds_start:upper_bounds_start + 8 * self.words_count].cast('d')
+        upper_bounds_start += 8 * self.words_count
+        self.max_dice_weights = view[upper_bounds_start:upper_bounds_start + 8 * self.words_count].cast('d')
+        self.collection_frequencies = view[words_statistics_start:words_statistics_start + 8 * self.words_count].cast('d')
+        words_statistics_start += 8 * self.words_count
+        self.min_lengths = view[words_statistics_start:words_statistics_start + 4 * self.words_count].cast('I')
+        self.collection_length = None  # Total length of the documents, computed on demand.
+        self.empty_postings = (array('L'), array(self.weights_type))
+        self.docs_words_frequencies = None  # Document-major view, derived on demand.
+        self.sparse_scorer = None  # Built on the first batch search, False if numpy or scipy is not installed.
+        # Results of the recent queries, keyed on the normalised query and the model. Each reader has its own cache,
+        # so loading another inverse file starts with an empty one. Hits and misses: self.query_cache.cache_info().
+        self.query_cache = lru_cache(cache_size)(self.run_query)
+        self.documents_ids = [doc_id for doc_id, count in enumerate(self.documents_unique_terms) if count]
+        self.delta = None  # DeltaSegment, once the file has updates.
+        self.update_lock = threading.Lock()
+        self.log_size = 0  # Offset of the end of the last complete batch of the log, see DeltaSegment.
+        if isfile(DeltaSegment.path_for(filepath)):
+            batches, self.log_size = DeltaSegment.read_batches(DeltaSegment.path_for(filepath))
+            for deleted_ids, added_documents, _ in batches:
+                self.apply_batch(deleted_ids, added_documents)
+
+    def get_documents_count(self):  # Number of documents in the inverse file.
+        return len(self.documents_ids)
+
+    def get_collection_length(self):  # Total length of the documents, in words.
+        if self.collection_length is None:
+            self.collection_length = sum(self.documents_lengths[doc_id] for doc_id in self.documents_ids)
+        return self.collection_length
+
+    def get_words_count(self):  # Number of words in the inverse file and its delta segment.
+        return self.words_count + (len(self.delta.words) if self.delta is not None else 0)
+
+    def __len__(self):
+        return self.get_words_count()
+
+    def get_word(self, index):
+        if index >= self.words_count:
+            return self.delta.words[index - self.words_count].encode()
+        start = self.terms_start + self.term_offsets[index]
+        return self.mapping[start:self.terms_start + self.term_offsets[index + 1]]
+
+    def find_word(self, word):
+        """
+        Binary search a word in the sorted term dictionary.
+        :param word: str representing the word.
+        :return: int index of the word, or -1 if it is not in the inverse file.
+        """
+        key = word.encode()
+        low, high = 0, self.words_count
+        while low < high:
+            middle = (low + high) // 2
+            if self.get_word(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.words_count and self.get_word(low) == key:
+            return low
+        if self.delta is not None:
+            return self.delta.words_indexes.get(word, -1)
+        return -1
+
+    def decode_postings(self, index):
+        """
+        Decode the posting list of a word, merged with its delta segment if there is one.
+        :param index: int index of the word, see find_word.
+        :return: tuple of two parallel arrays: the sorted document IDs and the weights of the word in them.
+        """
+        if self.delta is None:
+            return self.decode_main_postings(index)
+        return self.merged_postings(index)
+
+    def decode_main_postings(self, index):  # Posting list of a word of the inverse file itself.
+        start = self.postings_start + self.postings_offsets[index]
+        end = self.postings_start + self.postings_offsets[index + 1]
+        weights = array(self.weights_type)
+        weights_start = end - weights.itemsize * self.main_documents_frequencies[index]
+        weights.frombytes(self.mapping[weights_start:end])
+        return InverseFileFormat.decode_doc_ids(self.mapping[start:weights_start]), weights
+
+    def get_document_words_frequencies(self, document_id):
+        """
+        Return a dict containing the words of a document with their frequencies.
+        :param document_id: int representing ID of the document.
+        :return: dict of words as keys and their frequencies as values in the selected document.
+        """
+        assert isinstance(document_id, int)
+        if self.docs_words_frequencies is None:
+            self.docs_words_frequencies = {}
+            for index in range(self.get_words_count()):
+                word = self.get_word(index).decode()
+                for doc_id, frequency in zip(*self.decode_postings(index)):
+                    try:
+                        self.docs_words_frequencies[doc_id][word] = frequency
+                    except KeyError:
+                        self.docs_words_frequencies[doc_id] = {word: frequency}
+        return self.docs_words_frequencies[document_id]
+
+    def get_word_postings(self, word):
+        """
+        Return the posting list of a word.
+        :param word: str representing the word.
+        :return: tuple of two parallel arrays: the sorted document IDs and the frequencies of the word in them.
+        """
+        index = self.find_word(word)
+        if index < 0:
+            return self.empty_postings
+        return self.decode_postings(index)
+
+    def get_word_documents_frequencies(self, word):
+        """
+        Return a dict containing the frequencies of the word in each document.
+        :param word: str representing the word.
+        :return: dict of document IDs (int) as keys and the frequencies (float) as values.
+        """
+        assert isinstance(word, str)
+        return dict(zip(*self.get_word_postings(word)))
+
+    def get_word_documents_ids(self, word):
+        """
+        Return the sorted posting list of a word.
+        :param word: str representing the word.
+        :return: sorted array of the IDs (int) of the documents containing the word.
+        """
+        return self.get_word_postings(word)[0]
+
+    def add_documents(self, documents):
+        """
+        Add documents to the delta segment, replacing those having the same IDs, see update. Their titles and summaries
+        go to the log as well, for the document store.
+        :param documents: iterable of CACMDocument.
+        """
+        added_documents, added_texts = {}, {}
+        for document in documents:
+            added_documents[document.get_document_number()] = dict(InverseFileWriter.document_frequencies(document))
+            added_texts[document.get_document_number()] = DocumentStore.compress(document)
+        self.update((), added_documents, added_texts)
+
+    def delete_documents(self, doc_ids):
+        """
+        Delete documents, see update. Unknown IDs are ignored.
+        :param doc_ids: iterable of int document IDs.
+        """
+        self.update(list(doc_ids), {})
+
+    def update(self, deleted_ids, added_documents, added_texts=None):
+        """
+        Apply a batch of updates without rebuilding the inverse file: the batch is appended to the log of the delta
+        segment and indexed in memory, in a time proportional to its size. The searches merge the inverse file and its
+        delta segment from then on, so the documents count, the documents frequencies and the statistics of the
+        documents take the updates into account. Other readers of the file see the updates once they reopen it.
+        A file has a single writer at a time: an incomplete batch at the end of the log is cut off before appending.
+        :param deleted_ids: list of int IDs of the documents to delete.
+        :param added_documents: dict of the IDs of the documents to add or replace, mapped to dicts of their words and
+        frequencies.
+        :param added_texts: dict of IDs of added documents mapped to their compressed titles and summaries (see
+        DocumentStore.compress), the document store knowing no text for the others.
+        :raise ValueError: if the file holds tf-idf weights, which depend on the whole collection.
+        """
+        if self.weights_type == 'f':
+            raise ValueError('Only an inverse file of raw frequencies can be updated, rebuild the tf-idf one')
+        with self.update_lock:
+            log_path = DeltaSegment.path_for(self.filepath)
+            DeltaSegment.repair(log_path, self.log_size)
+            self.log_size = DeltaSegment.append_batch(log_path, deleted_ids, added_documents, added_texts or {})
+            self.apply_batch(deleted_ids, added_documents)
+
+    def apply_batch(self, deleted_ids, added_documents):
+        if self.delta is None:
+            self.start_delta()
+        for doc_id in deleted_ids:
+            self.remove_document(doc_id)
+        for doc_id, words_frequencies in added_documents.items():
+            self.remove_document(doc_id)
+            if words_frequencies:  # A document without any word is not indexed, as in the inverse file.
+                self.insert_document(doc_id, words_frequencies)
+        self.delta.batches_count += 1
+        # The results, the postings and the views derived from the previous state are dropped.
+        self.query_cache.cache_clear()
+        self.merged_postings.cache_clear()
+        self.docs_words_frequencies = None
+        self.collection_length = None
+        if self.sparse_scorer:
+            self.sparse_scorer = None
+
+    def start_delta(self):  # Attach an empty delta segment, replacing the arrays of the file by their merged views.
+        self.delta = delta = DeltaSegment(len(self.documents_unique_terms))
+        self.merged_postings = lru_cache(1024)(self.merge_postings)
+        self.documents_frequencies = MergedDocumentsFrequencies(self)
+        self.documents_squared_norms = SegmentView(self.documents_squared_norms, delta.squared_norms)
+        self.documents_lengths = SegmentView(self.documents_lengths, delta.lengths)
+        self.documents_unique_terms = SegmentView(self.documents_unique_terms, delta.unique_terms)
+        self.max_weights = SegmentView(self.max_weights, delta.max_weights)
+        self.max_cos_weights = SegmentView(self.max_cos_weights, delta.max_cos_weights)
+        self.max_dice_weights = SegmentView(self.max_dice_weights, delta.max_dice_weights)
+        self.main_collection_frequencies = self.collection_frequencies
+        self.collection_frequencies = MergedCollectionFrequencies(self)
+        self.min_lengths = SegmentView(self.min_lengths, delta.min_lengths)
+
+    def remove_document(self, doc_id):
+        """
+        Remove a document from the delta segment, or mark it as deleted if it is in the inverse file.
+        """
+        delta = self.delta
+        position = bisect_left(self.documents_ids, doc_id)
+        if position == len(self.documents_ids) or self.documents_ids[position] != doc_id:
+            return
+        del self.documents_ids[position]
+        words_frequencies = delta.documents.pop(doc_id, None)
+        if words_frequencies is None:
+            delta.delete(doc_id)
+            return
+        for word in words_frequencies:
+            del delta.postings[word][doc_id]
+        for statistics in (delta.squared_norms, delta.lengths, delta.unique_terms):
+            del statistics[doc_id]
+
+    def insert_document(self, doc_id, words_frequencies):
+        delta = self.delta
+        squared_norm = sum(frequency**2 for _, frequency in sorted(words_frequencies.items()))
+        delta.documents[doc_id] = words_frequencies
+        delta.squared_norms[doc_id] = float(squared_norm)
+        delta.lengths[doc_id] = sum(words_frequencies.values())
+        delta.unique_terms[doc_id] = len(words_frequencies)
+        for word, frequency in words_frequencies.items():
+            delta.postings.setdefault(word, {})[doc_id] = frequency
+            index = self.find_word(word)
+            if index < 0:
+                index = self.words_count + len(delta.words)
+                delta.words.append(word)
+                delta.words_indexes[word] = index
+            # The bounds only grow and the minimum lengths only shrink: a removed document leaves them beyond the
+            # actual extrema, which is still safe.
+            for bounds, bound in ((self.max_weights, frequency),
+                                  (self.max_cos_weights, frequency / squared_norm**(1/2)),
+                                  (self.max_dice_weights, frequency / (1 + squared_norm))):
+                if bound > bounds[index]:
+                    bounds.overrides[index] = bound
+            if not self.min_lengths[index] or delta.lengths[doc_id] < self.min_lengths[index]:
+                self.min_lengths.overrides[index] = delta.lengths[doc_id]
+        insort(self.documents_ids, doc_id)
+
+    def merge_postings(self, index):  # Uncached merged_postings: decode_postings with a delta segment.
+        delta = self.delta
+        if index < self.words_count:
+            doc_ids, weights = self.decode_main_postings(index)
+            added = delta.postings.get(self.get_word(index).decode())
+        else:
+            doc_ids, weights = self.empty_postings
+            added = delta.postings.get(delta.words[index - self.words_count])
+        if not delta.deleted_count and not added:
+            return doc_ids, weights
+        postings = zip(doc_ids, weights)
+        if delta.deleted_count:
+            postings = ((doc_id, weight) for doc_id, weight in postings if not delta.is_deleted(doc_id))
+        if added:
+            postings = heapq.merge(postings, sorted(added.items()))
+        merged_doc_ids, merged_weights = array('L'), array(self.weights_type)
+        for doc_id, weight in postings:
+            merged_doc_ids.append(doc_id)
+            merged_weights.append(weight)
+        return merged_doc_ids, merged_weights
+
+    def merge(self):
+        """
+        Compact the delta segment into the inverse file: the merged inverse file is written next to it, then replaces
+        it, and the log is removed. Its document store, if any, is rewritten with the documents of the log before. The
+        searches of this reader keep using the files it mapped, which stay valid, so open a new reader to use the merged
+        file. The updates wait for the end of the merge.
+        :return: int number of batches merged.
+        """
+        with self.update_lock:
+            if self.delta is None or not self.delta.batches_count:
+                return 0
+            words = heapq.merge(
+                ((self.get_word(index), index) for index in range(self.words_count)),
+                sorted((word.encode(), index) for word, index in self.delta.words_indexes.items())
+            )
+            max_weight = max(chain(self.max_weights.base, self.max_weights.overrides.values()), default=0)
+            size = max(self.documents_ids, default=0) + 1
+            statistics = {
+                'squared_norms': array('d', [0.0]) * size, 'lengths': array('L', [0]) * size,
+                'unique_terms': array('L', [0]) * size
+            }
+            for doc_id in self.documents_ids:
+                statistics['squared_norms'][doc_id] = self.documents_squared_norms[doc_id]
+                statistics['lengths'][doc_id] = self.documents_lengths[doc_id]
+                statistics['unique_terms'][doc_id] = self.documents_unique_terms[doc_id]
+            merged_path = self.filepath + '.merging'
+            InverseFileFormat.write_sorted(
+                merged_path,
+                ((word.decode(), dict(zip(*postings))) for word, postings in (
+                    (word, self.merge_postings(index)) for word, index in words
+                ) if postings[0]),
+                InverseFileFormat.integer_weights_type(max_weight), statistics
+            )
+            log_path = DeltaSegment.path_for(self.filepath)
+            if isfile(DocumentStore.path_for(self.filepath)):  # Replaying the log on the merged store changes nothing.
+                DocumentStore(DocumentStore.path_for(self.filepath), log_path=log_path).merge()
+            replace(merged_path, self.filepath)
+            remove(log_path)
+            return self.delta.batches_count
+
+    def start_merge(self):
+        """
+        Run merge in a background thread.
+        :return: concurrent.futures.Future of its result.
+        """
+        executor = ThreadPoolExecutor(1)
+        future = executor.submit(self.merge)
+        executor.shutdown(wait=False)
+        return future
+
+    @staticmethod
+    def run_query(search, *arguments):  # Wrapped by the query cache, which keys on the search and its arguments.
+        return search(*arguments)
+
+    def search_query_matching_score(self, query, k=None):
+        """
+        Return a dict containing the matching score of each relevant document.
+        :param query: str of words.
+        :param k: int, to get only the k best documents (see search_top_k).
+        :return: dict which its keys are the IDs of the documents and its values are the relevance of each document,
+        or if k is given, list of the k best (document ID, relevance) sorted by decreasing relevance.
+        """
+        assert isinstance(query, str)
+        return copy(self.query_cache(self.compute_matching_score, QueryPreprocessing.analyzer.query_tokens(query), k))
+
+    def compute_matching_score(self, query_words, k):  # Uncached search_query_matching_score of the query words.
+        if k is not None:
+            return self.search_top_k(query_words, 'inner_product', k, len(query_words))
+        docs_relevance = {}
+        for word in query_words:
+            for doc_id, frequency in zip(*self.get_word_postings(word)):
+                try:
+                    docs_relevance[doc_id] += frequency
+                except KeyError:
+                    docs_relevance[doc_id] = frequency
+        return docs_relevance
+
+    def search_query_boolean(self, boolean_query):
+        """
+        Return a list of IDs of the relevant documents to a boolean query using the boolean search model.
+        :param boolean_query: str representing the query.
+        :return: list of IDs of the relevant documents.
+        """
+        assert isinstance(boolean_query, str)  # Type checking
+        return copy(self.query_cache(self.compute_boolean, QueryPreprocessing.analyzer.boolean_tokens(boolean_query)))
+
+    def compute_boolean(self, tokens):  # Uncached search_query_boolean of the query tokens.
+        return list(BooleanQuery(tokens).evaluate(self.get_word_documents_ids, self.documents_ids))
+
+    def search_query_vector(self, query, model, k=None, statistics=None, parameters=None):
+        """
+        Return a dict of documents IDs with the corresponding similarities.
+        :param query: str representing the query.
+        :param model: str representing which vector model is used, or one of the probabilistic models of an inverse
+        file of raw frequencies (see ProbabilisticScorer).
+        :param k: int, to get only the k most similar documents (see search_top_k).
+        :param statistics: tuple of the statistics of the collection used by the probabilistic models, as returned by
+        collection_statistics, by default those of this inverse file.
+        :param parameters: tuple of the parameters of the probabilistic models, see ProbabilisticScorer.parameters.
+        :return: dict whose its keys are the documents IDs and the values are the similarities, or if k is given, list
+        of the k best (document ID, similarity) sorted by decreasing similarity.
+        :raise ValueError: for a probabilistic model if the file holds tf-idf weights.
+        """
+        assert isinstance(query, str)
+        query_words = QueryPreprocessing.analyzer.query_tokens(query)
+        if model in ProbabilisticScorer.models:
+            if self.weights_type == 'f':
+                raise ValueError('The probabilistic models need an inverse file of raw frequencies')
+            return copy(self.query_cache(self.compute_probabilistic, query_words, model, k, statistics,
+                                         parameters or ProbabilisticScorer.parameters()))
+        assert model in InverseFileReader.vector_models
+        return copy(self.query_cache(self.compute_vector, query_words, model, k))
+
+    def compute_vector(self, query_words, model, k):  # Uncached search_query_vector of the query words.
+        if k is not None:
+            return self.search_top_k(list(dict.fromkeys(query_words)), model, k, len(query_words))
+        return self.score_models(query_words, (model,))[model]
+
+    def compute_probabilistic(self, query_words, model, k, statistics, parameters):
+        """
+        Uncached search_query_vector of the query words for a probabilistic model.
+        """
+        indexes = [index for index in (self.find_word(word) for word in query_words) if index >= 0]
+        if not indexes:
+            return {} if k is None else []
+        statistics = statistics or self.collection_statistics(query_words)
+        if not statistics[0]:  # Every document was deleted.
+            return {} if k is None else []
+        scorer = ProbabilisticScorer(self, model, indexes, len(query_words), statistics, parameters)
+        if k is None:
+            return scorer.score_documents()
+        return self.search_top_k(query_words, model, k, len(query_words), scorer)
+
+    def collection_statistics(self, query_words):
+        """
+        Return the statistics of the collection used by the probabilistic models to score a query. Those of a sharded
+        index are the sums of the statistics of its shards.
+        :param query_words: list of the words of the query.
+        :return: tuple of the number of documents, their total length, and a tuple of (word, documents frequency,
+        collection frequency) for each distinct query word found in the documents.
+        """
+        words_statistics = []
+        for word in dict.fromkeys(query_words):
+            index = self.find_word(word)
+            if index >= 0 and self.documents_frequencies[index]:
+                words_statistics.append((word, self.documents_frequencies[index], self.collection_frequencies[index]))
+        return self.get_documents_count(), self.get_collection_length(), tuple(words_statistics)
+
+    def accumulate(self, query_words):
+        """
+        Compute the inner product of a query with the documents, term at a time: only the postings of the (distinct)
+        query words are visited.
+        :param query_words: list of the words of the query.
+        :return: dict of the IDs of the documents containing a query word and their inner products.
+        """
+        docs_relevance = {}
+        for word in dict.fromkeys(query_words):
+            for doc_id, frequency in zip(*self.get_word_postings(word)):
+                try:
+                    docs_relevance[doc_id] += frequency
+                except KeyError:
+                    docs_relevance[doc_id] = frequency
+        return docs_relevance
+
+    def search_query_models(self, query, models, k):
+        """
+        Return the k best documents of several vector models, derived from a single accumulation of the query (see
+        score_models): the results of search_query_vector for each model, the postings being visited once.
+        :param query: str representing the query.
+        :param models: iterable of str representing the vector models.
+        :param k: int number of documents of each model.
+        :return: dict of the models and their lists of the k best (document ID, similarity), see search_query_vector.
+        """
+        assert isinstance(query, str)
+        models = tuple(models)
+        assert all(model in InverseFileReader.vector_models for model in models)
+        query_words = QueryPreprocessing.analyzer.query_tokens(query)
+        models_results = self.query_cache(self.compute_models, query_words, models, k)
+        return {model: copy(results) for model, results in models_results.items()}
+
+    def compute_models(self, query_words, models, k):  # Uncached search_query_models of the query words.
+        docs_relevance = self.accumulate(query_words)
+        return {model: self.rank_documents(docs_relevance, model, k, len(query_words)) for model in models}
+
+    def score_models(self, query_words, models):
+        """
+        Derive the similarities of several vector models from a single accumulation of a query.
+        :param query_words: list of the words of the query.
+        :param models: iterable of str representing the vector models.
+        :return: dict of the models and their dicts of document IDs and similarities.
+        """
+        docs_relevance = self.accumulate(query_words)
+        return {
+            model: docs_relevance if model == 'inner_product' else {
+                doc_id: self.normalize(model, relevance, len(query_words), self.documents_squared_norms[doc_id])
+                for doc_id, relevance in docs_relevance.items()
+            } for model in models
+        }
+
+    def search_queries_vector(self, queries, model):
+        """
+        Search a batch of queries, in one sparse matrix product when numpy and scipy are installed.
+        :param queries: list of str representing the queries.
+        :param model: str representing which vector model is used.
+        :return: list of dicts as returned by search_query_vector, one for each query.
+        """
+        assert model in InverseFileReader.vector_models
+        queries_words = tuple(QueryPreprocessing.analyzer.query_tokens(query) for query in queries)
+        return [copy(results) for results in self.query_cache(self.compute_vectors, queries_words, model)]
+
+    def compute_vectors(self, queries_words, model):  # Uncached search_queries_vector of the queries words.
+        if self.sparse_scorer is None:
+            try:
+                self.sparse_scorer = SparseScorer(self)
+            except ImportError:  # No numpy or scipy: the queries are searched one by one.
+                self.sparse_scorer = False
+        if not self.sparse_scorer:
+            return [self.compute_vector(query_words, model, None) for query_words in queries_words]
+        return self.sparse_scorer.search(queries_words, model)
+
+    @staticmethod
+    def normalize(model, relevance, query_length, squared_norm):
+        """
+        Turn the inner product of a query and a document into the similarity of a vector model.
+        """
+        if model == 'dice':
+            return 2 * relevance / (query_length + squared_norm)
+        if model == 'cos':
+            return relevance / (query_length * squared_norm)**(1/2)
+        if model == 'jaccard':
+            return relevance / (query_length + squared_norm - relevance)
+        return relevance
+
+    def search_top_k(self, query_words, model, k, query_length, scorer=None):
+        """
+        Return the k best documents. Those of a vector model are selected from the scores of every document containing
+        a query word (see search_exhaustive): the bounds of their weights are too loose for MaxScore to skip enough
+        postings to pay for itself.
+        The probabilistic models use MaxScore, document-at-a-time, with a heap of size k. The posting lists are sorted
+        by the upper bound of their contribution to the score. Once the k-th best score is above the sum of the
+        smallest bounds, the documents found only in those (non essential) lists are skipped, and the other lists are
+        only probed while the document can still enter the top k.
+        :param query_words: list of words, a repeated word adding its weight again.
+        :param model: str representing which model is used.
+        :param k: int number of documents to return.
+        :param query_length: int number of words of the query used by the normalisations.
+        :param scorer: ProbabilisticScorer of the query for a probabilistic model.
+        :return: list of (document ID, score) sorted by decreasing score, then increasing ID.
+        """
+        indexes = [index for index in (self.find_word(word) for word in query_words) if index >= 0]
+        if not indexes or k <= 0:
+            return []
+        if scorer is None or \
+                sum(self.documents_frequencies[index] for index in set(indexes)) <= k * self.exhaustive_ratio:
+            return self.search_exhaustive(indexes, model, k, query_length, scorer)
+        multiplicities = Counter(indexes)
+        lists = sorted((scorer.bounds[index] * multiplicity, index) for index, multiplicity in multiplicities.items())
+        terms = [index for _, index in lists]
+        terms_multiplicities = [multiplicities[index] for index in terms]
+        cumulated_bounds = list(accumulate(bound for bound, _ in lists))
+        end = float('inf')  # Sentinel closing every posting list.
+        doc_ids_lists, weights_lists = [], []
+        for index in terms:
+            doc_ids, weights = self.decode_postings(index)
+            doc_ids_lists.append(doc_ids.tolist() + [end])
+            weights_lists.append(weights)
+        positions = [0] * len(terms)
+        heads = [doc_ids[0] for doc_ids in doc_ids_lists]  # Current document of each list.
+        essential = [(head, i) for i, head in enumerate(heads)]  # Heap of the essential lists by current document.
+        heapq.heapify(essential)
+        first_essential = 0
+        cutoff = -float('inf')  # A document needs a bound reaching it to enter the top k.
+        heap = []
+        while True:
+            while essential and essential[0][1] < first_essential:  # Lists no longer essential leave the heap.
+                heapq.heappop(essential)
+            if not essential or essential[0][0] == end:
+                break
+            candidate = essential[0][0]
+            length = self.documents_lengths[candidate]
+            partial = scorer.document_score(length)  # The scores of the postings are summed, with that of the document.
+            found = {}
+            while essential and essential[0][0] == candidate:
+                i = essential[0][1]
+                if i >= first_essential:
+                    weight = found[terms[i]] = scorer.term_score(terms[i], weights_lists[i][positions[i]], length)
+                    partial += weight * terms_multiplicities[i]
+                    positions[i] += 1
+                    heads[i] = doc_ids_lists[i][positions[i]]
+                    heapq.heapreplace(essential, (heads[i], i))
+                else:
+                    heapq.heappop(essential)
+            for i in range(first_essential - 1, -1, -1):  # Non essential lists, highest bound first.
+                if partial + cumulated_bounds[i] < cutoff:
+                    break
+                if heads[i] < candidate:
+                    positions[i] = bisect_left(doc_ids_lists[i], candidate, positions[i])
+                    heads[i] = doc_ids_lists[i][positions[i]]
+                if heads[i] == candidate:
+                    weight = found[terms[i]] = scorer.term_score(terms[i], weights_lists[i][positions[i]], length)
+                    partial += weight * terms_multiplicities[i]
+            else:
+                if partial < cutoff:
+                    continue
+                # Same order as score_documents.
+                entry = (scorer.document_score(length) + sum(found[index] for index in indexes if index in found),
+                         -candidate)
+                if len(heap) < k:
+                    heapq.heappush(heap, entry)
+                elif entry > heap[0]:
+                    heapq.heapreplace(heap, entry)
+                if len(heap) == k:
+                    cutoff = heap[0][0] - abs(heap[0][0]) * 1e-9  # Margin for the rounding of the partial sums.
+                    while first_essential < len(terms) and cumulated_bounds[first_essential] < cutoff:
+                        first_essential += 1
+        return [(-neg_doc_id, score) for score, neg_doc_id in sorted(heap, reverse=True)]
+
+    def search_exhaustive(self, indexes, model, k, query_length, scorer=None):
+        """
+        Return the k best documents, see search_top_k, by scoring every document containing a query word, term at a
+        time. The probabilistic models only use it when k is close to the number of such documents.
+        :param indexes: list of the indexes of the query words, a repeated word adding its weight again.
+        """
+        if scorer is not None:
+            best = heapq.nlargest(k, ((score, -doc_id) for doc_id, score in scorer.score_documents().items()))
+            return [(-neg_doc_id, score) for score, neg_doc_id in best]
+        docs_relevance = {}
+        for index in indexes:  # Same summation order as the exact scores of search_top_k.
+            for doc_id, weight in zip(*self.decode_postings(index)):
+                try:
+                    docs_relevance[doc_id] += weight
+                except KeyError:
+                    docs_relevance[doc_id] = weight
+        return self.rank_documents(docs_relevance, model, k, query_length)
+
+    def rank_documents(self, docs_relevance, model, k, query_length):
+        """
+        Select the k best documents of a vector model from the inner products of a query, ranked as search_top_k does.
+        :param docs_relevance: dict of the IDs of the documents and their inner products with the query.
+        :return: list of (document ID, score) sorted by decreasing score, then increasing ID.
+        """
+        rank_model = 'dice' if model == 'jaccard' else model
+        squared_norms = self.documents_squared_norms
+        best = heapq.nlargest(k, (
+            (self.normalize(rank_model, relevance, query_length, squared_norms[doc_id]), -doc_id,
+             self.normalize(model, relevance, query_length, squared_norms[doc_id]))
+            for doc_id, relevance in docs_relevance.items()
+        ))
+        return [(-neg_doc_id, score) for _, neg_doc_id, score in best]
+
+
+class ProbabilisticScorer:
+    """
+    Scores of a query under a probabilistic model, computed at query time from the raw frequencies, the documents
+    lengths and the collection statistics of an inverse file, so that no weighting scheme is written in the file:
+    - 'bm25': sum over the query words of idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / average length)),
+      with idf = log(1 + (N - df + 0.5) / (df + 0.5));
+    - 'dirichlet': log likelihood of the query under the language model of the document smoothed by the one of the
+      collection with a Dirichlet prior, sum over the query words of log(1 + tf / (mu * cf / collection length)), plus
+      query length * log(mu / (length + mu)). The part common to all the documents is left out, and only the documents
+      containing a query word are ranked.
+    A word repeated in the query adds its score again.
+    """
+
+    models = ('bm25', 'dirichlet')
+    k1 = 1.2  # Default parameters of the models.
+    b = 0.75
+    mu = 2000
+
+    def __init__(self, inverse_file_reader, model, indexes, query_length, statistics, parameters):
+        """
+        :param inverse_file_reader: InverseFileReader instance of raw frequencies.
+        :param model: str, one of models.
+        :param indexes: list of the indexes of the query words in the inverse file.
+        :param query_length: int number of words of the query.
+        :param statistics: tuple of the statistics of the collection, see InverseFileReader.collection_statistics.
+        :param parameters: tuple of the parameters of the models, see parameters.
+        """
+        documents_count, collection_length, words_statistics = statistics
+        words_statistics = {word: (documents_frequency, collection_frequency)
+                            for word, documents_frequency, collection_frequency in words_statistics}
+        self.reader = inverse_file_reader
+        self.model = model
+        self.indexes = indexes
+        self.query_length = query_length
+        self.k1, self.b, self.mu = parameters
+        self.average_length = collection_length / documents_count
+        self.factors, self.bounds = {}, {}  # Factor of the score and bound of the score of each query word.
+        for index in set(indexes):
+            documents_frequency, collection_frequency = words_statistics.get(
+                inverse_file_reader.get_word(index).decode(), (0, 0)
+            )
+            if not documents_frequency:  # All the documents of the word were deleted.
+                self.factors[index] = self.bounds[index] = 0
+            elif model == 'bm25':
+                idf = log(1 + (documents_count - documents_frequency + 0.5) / (documents_frequency + 0.5))
+                self.factors[index] = idf
+                self.bounds[index] = self.term_score(index, inverse_file_reader.max_weights[index],
+                                                     inverse_file_reader.min_lengths[index])
+            else:
+                self.factors[index] = collection_length / (self.mu * collection_frequency)
+                self.bounds[index] = self.term_score(index, inverse_file_reader.max_weights[index], 0)
+
+    @staticmethod
+    def parameters():
+        return ProbabilisticScorer.k1, ProbabilisticScorer.b, ProbabilisticScorer.mu
+
+    def term_score(self, index, frequency, length):
+        """
+        Score of a query word in a document, increasing with its frequency and decreasing with the document length.
+        :param index: int index of the word.
+        :param frequency: int frequency of the word in the document.
+        :param length: int length of the document.
+        """
+        if self.model == 'bm25':
+            return self.factors[index] * frequency * (self.k1 + 1) / (
+                frequency + self.k1 * (1 - self.b + self.b * length / self.average_length)
+            )
+        return log(1 + frequency * self.factors[index])
+
+    def document_score(self, length):  # Score of a document of the given length which does not depend on the words.
+        if self.model == 'bm25':
+            return 0
+        return self.query_length * log(self.mu / (length + self.mu))
+
+    def score_documents(self):
+        """
+        Score every document containing a query word, term at a time.
+        :return: dict of the document IDs and their scores.
+        """
+        lengths = self.reader.documents_lengths
+        docs_relevance = {}
+        for index in self.indexes:  # Same summation order as the exact scores of search_top_k.
+            for doc_id, frequency in zip(*self.reader.decode_postings(index)):
+                score = self.term_score(index, frequency, lengths[doc_id])
+                try:
+                    docs_relevance[doc_id] += score
+                except KeyError:
+                    docs_relevance[doc_id] = score
+        return {
+            doc_id: self.document_score(lengths[doc_id]) + relevance for doc_id, relevance in docs_relevance.items()
+        }
+
+
+class SparseScorer:
+    """
+    Optional NumPy/SciPy backend scoring batches of vector queries.
+    The inverse file is held as a CSR document-term matrix with the squared norms of its rows: a batch of queries is
+    scored with one sparse matrix product, and the similarities are normalised with array operations.
+    """
+
+    def __init__(self, inverse_file_reader):
+        """
+        Build the document-term matrix of an inverse file.
+        :param inverse_file_reader: InverseFileReader instance.
+        """
+        global numpy, sparse
+        import numpy
+        from scipy import sparse
+        self.reader = inverse_file_reader
+        rows, columns, data = array('L'), array('L'), array('d')
+        for index in range(inverse_file_reader.get_words_count()):
+            doc_ids, weights = inverse_file_reader.decode_postings(index)
+            rows.extend(doc_ids)
+            columns.extend([index] * len(doc_ids))
+            data.fromlist(weights.tolist())
+        self.squared_norms = numpy.asarray(inverse_file_reader.documents_squared_norms)
+        self.matrix = sparse.csr_matrix(
+            (numpy.asarray(data), (numpy.asarray(rows), numpy.asarray(columns))),
+            shape=(len(self.squared_norms), inverse_file_reader.get_words_count())
+        )
+
+    def search(self, queries_words, model):
+        """
+        Return the similarities of the documents to each query, like InverseFileReader.search_query_vector.
+        :param queries_words: list of the words of each query, as returned by Analyzer.query_tokens.
+        :param model: str representing which vector model is used.
+        :return: list of dicts of document IDs and similarities, one for each query.
+        """
+        rows, columns, queries_lengths = [], [], []
+        for query_number, query_words in enumerate(queries_words):
+            queries_lengths.append(len(query_words))
+            for word in dict.fromkeys(query_words):
+                index = self.reader.find_word(word)
+                if index >= 0:
+                    rows.append(query_number)
+                    columns.append(index)
+        queries_matrix = sparse.csr_matrix(
+            (numpy.ones(len(rows)), (rows, columns)), shape=(len(queries_words), self.matrix.shape[1])
+        )
+        similarities = sparse.csr_matrix(queries_matrix @ self.matrix.T)  # Queries x documents.
+        relevance = similarities.data
+        squared_norms = self.squared_norms[similarities.indices]
+        queries_lengths = numpy.repeat(numpy.array(queries_lengths, dtype=float), numpy.diff(similarities.indptr))
+        if model == 'dice':
+            similarities.data = 2 * relevance / (queries_lengths + squared_norms)
+        elif model == 'cos':
+            similarities.data = relevance / numpy.sqrt(queries_lengths * squared_norms)
+        elif model == 'jaccard':
+            similarities.data = relevance / (queries_lengths + squared_norms - relevance)
+        return [
+            dict(zip(similarities.indices[start:end].tolist(), similarities.data[start:end].tolist()))
+            for start, end in zip(similarities.indptr[:-1], similarities.indptr[1:])
+        ]
+
+
+class Analyzer:
+    """
+    Single-pass analyzer turning a text into its indexed words, shared by the indexing and the queries.
+    The words are matched directly in the lowercased text, without intermediate strings. Each distinct word of the
+    indexed documents is checked against the stop list once and interned. The words of recent queries are kept in an
+    LRU cache instead, so that the queries of a long running process do not grow the memory.
+    """
+
+    token_regexp = re.compile(r"[\w']+")
+    boolean_token_regexp = re.compile(r"[\w']+|[&|~()]")
+
+    def __init__(self, stop_list, cache_size=1024):
+        """
+        :param stop_list: iterable of str words to leave out.
+        :param cache_size: int number of recent query strings whose words are kept in memory.
+        """
+        self.stop_list = frozenset(stop_list)
+        self.words = {}  # Lowercased token of the indexed documents -> interned word, or '' for a stop word.
+        self.query_tokens = lru_cache(cache_size)(self.analyze_query)
+        self.boolean_tokens = lru_cache(cache_size)(self.analyze_boolean)
+
+    def word(self, token):
+        word = '' if token in self.stop_list else sys.intern(token)
+        self.words[token] = word
+        return word
+
+    def filter(self, tokens):
+        words = self.words
+        filtered = []
+        for token in tokens:
+            word = words.get(token)
+            if word is None:
+                word = self.word(token)
+            if word:
+                filtered.append(word)
+        return filtered
+
+    def tokens(self, text):
+        """
+        Return the words of a text: its lowercased runs of letters, digits and apostrophes, except the stop words.
+        :param text: str.
+        :return: list of str.
+        """
+        return self.filter(self.token_regexp.findall(text.lower()))
+
+    def filter_query(self, tokens):  # filter for a query, which leaves self.words as it is.
+        words = self.words
+        filtered = []
+        for token in tokens:
+            word = words.get(token)
+            if word is None:
+                word = '' if token in self.stop_list else token
+            if word:
+                filtered.append(word)
+        return filtered
+
+    def analyze_query(self, query):  # Uncached query_tokens.
+        return tuple(self.filter_query(self.token_regexp.findall(query.lower())))
+
+    def analyze_boolean(self, query):  # Uncached boolean_tokens: the words and the operators of a boolean query.
+        return tuple(self.filter_query(self.boolean_token_regexp.findall(query.lower())))
+
+
+class QueryPreprocessing:
+    """
+    Contain set of static methods for normalization and tokenizing
+    """
+
+    token_simple_regexp = re.compile(r"\s+")
+    token_boolean_regexp = re.compile(r"\s+|([&|~()])")
+    stop_list = None
+    analyzer = None  # Analyzer of the stop list, used by the indexing and the queries.
+
+    @staticmethod
+    def load_stop_list(path):
+        with open(path) as stop_file:
+            QueryPreprocessing.set_stop_list(set(w.rstrip('\r\n') for w in stop_file))
+
+    @staticmethod
+    def set_stop_list(stop_list):
+        QueryPreprocessing.stop_list = stop_list
+        QueryPreprocessing.analyzer = Analyzer(stop_list)
+
+    @staticmethod
+    def normalize_simple(query):
+        assert isinstance(query, str)
+        return ' '.join(QueryPreprocessing.analyzer.query_tokens(query))
+
+    @staticmethod
+    def normalize_boolean(query):
+        assert isinstance(query, str)
+        return ' '.join(QueryPreprocessing.analyzer.boolean_tokens(query))
+
+    @staticmethod
+    def tokenize_simple(query):
+        assert isinstance(query, str)
+        return [w for w in re.split(QueryPreprocessing.token_simple_regexp, query) if w]
+
+    @staticmethod
+    def tokenize_boolean(query):
+        assert isinstance(query, str)
+        return [w for w in re.split(QueryPreprocessing.token_boolean_regexp, query) if w]
+
+    @staticmethod
+    def replace_boolean_operators(boolean_query):
+        assert isinstance(boolean_query, str)
+        return boolean_query.replace('&', ' and ').replace('|', ' or ').replace('~', ' not ')
+
+
+class BooleanQuery:
+    """
+    Boolean query compiled into an AST and evaluated over sorted posting lists.
+    Precedence follows Python's: '~' binds tighter than '&', which binds tighter than '|'.
+    """
+
+    operators = ('&', '|', '~', '(', ')')
+
+    def __init__(self, query):
+        """
+        Parse a boolean query.
+        :param query: str using words, '&', '|', '~' and parentheses, or its tokens as returned by
+        Analyzer.boolean_tokens.
+        :raise ValueError: if the query is not well formed.
+        """
+        self.tokens = QueryPreprocessing.analyzer.boolean_tokens(query) if isinstance(query, str) else query
+        self.position = 0
+        self.tree = self.parse_or()
+        if self.position != len(self.tokens):
+            raise ValueError('Unexpected token {!r} in boolean query'.format(self.tokens[self.position]))
+
+    def next_token(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def parse_or(self):
+        node = self.parse_and()
+        while self.next_token() == '|':
+            self.position += 1
+            node = ('|', node, self.parse_and())
+        return node
+
+    def parse_and(self):
+        node = self.parse_not()
+        while self.next_token() == '&':
+            self.position += 1
+            node = ('&', node, self.parse_not())
+        return node
+
+    def parse_not(self):
+        if self.next_token() == '~':
+            self.position += 1
+            return ('~', self.parse_not())
+        return self.parse_atom()
+
+    def parse_atom(self):
+        token = self.next_token()
+        if token is None:
+            raise ValueError('Unexpected end of boolean query')
+        self.position += 1
+        if token == '(':
+            node = self.parse_or()
+            if self.next_token() != ')':
+                raise ValueError('Missing closing parenthesis in boolean query')
+            self.position += 1
+            return node
+        if token in BooleanQuery.operators:
+            raise ValueError('Unexpected token {!r} in boolean query'.format(token))
+        return ('word', token)
+
+    def evaluate(self, word_documents_ids, universe):
+        """
+        Return the IDs of the documents satisfying the query.
+        :param word_documents_ids: callable returning the sorted posting list of a word.
+        :param universe: sorted list of all the document IDs, used to resolve a top level negation.
+        :return: sorted list of IDs of the relevant documents.
+        """
+        docs, negated = self.evaluate_node(self.tree, word_documents_ids)
+        return BooleanQuery.difference(universe, docs) if negated else docs
+
+    def evaluate_node(self, node, word_documents_ids):
+        """
+        Evaluate a node to a pair (sorted doc IDs, negated), negated meaning the complement of the IDs.
+        Negations are kept symbolic so that '&' and '|' turn them into differences instead of scanning the universe.
+        """
+        if node[0] == 'word':
+            return word_documents_ids(node[1]), False
+        if node[0] == '~':
+            docs, negated = self.evaluate_node(node[1], word_documents_ids)
+            return docs, not negated
+        left, left_negated = self.evaluate_node(node[1], word_documents_ids)
+        right, right_negated = self.evaluate_node(node[2], word_documents_ids)
+        if node[0] == '&':
+            if not left_negated and not right_negated:
+                return BooleanQuery.intersection(left, right), False
+            if not left_negated:
+                return BooleanQuery.difference(left, right), False
+            if not right_negated:
+                return BooleanQuery.difference(right, left), False
+            return BooleanQuery.union(left, right), True  # ~a & ~b == ~(a | b)
+        else:
+            if not left_negated and not right_negated:
+                return BooleanQuery.union(left, right), False
+            if not left_negated:
+                return BooleanQuery.difference(right, left), True  # a | ~b == ~(b - a)
+            if not right_negated:
+                return BooleanQuery.difference(left, right), True
+            return BooleanQuery.intersection(left, right), True  # ~a | ~b == ~(a & b)
+
+    @staticmethod
+    def intersection(a, b):
+        if len(a) > len(b):
+            a, b = b, a
+        result = []
+        position = 0
+        for doc_id in a:  # Binary search the shorter list into the longer one.
+            position = bisect_left(b, doc_id, position)
+            if position == len(b):
+                break
+            if b[position] == doc_id:
+                result.append(doc_id)
+        return result
+
+    @staticmethod
+    def union(a, b):
+        result = []
+        i = j = 0
+        while i < len(a) and j < len(b):
+            if a[i] < b[j]:
+                result.append(a[i])
+                i += 1
+            elif a[i] > b[j]:
+                result.append(b[j])
+                j += 1
+            else:
+                result.append(a[i])
+                i += 1
+                j += 1
+        result.extend(a[i:])
+        result.extend(b[j:])
+        return result
+
+    @staticmethod
+    def difference(a, b):
+        result = []
+        position = 0
+        for doc_id in a:
+            position = bisect_left(b, doc_id, position)
+            if position == len(b) or b[position] != doc_id:
+                result.append(doc_id)
+        return result
@@ -0,0 +1,186 @@
+"""
+Evaluation of the ranking models over the test queries of the collection, with ranked retrieval metrics.
+"""
+import re
+import statistics
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from math import log2
+from multiprocessing import get_context
+
+from core import InverseFileReader, ProbabilisticScorer, QueryPreprocessing
+
+recall_levels = tuple(level / 10 for level in range(11))  # Recall levels of the interpolated precision.
+
+
+def ranked_measures(ranking, relevant_documents, cutoffs=(5, 10, 20), ndcg_depth=10):
+    """
+    Measure a ranked list of documents in a single pass over it.
+    :param ranking: list of (document ID, score) sorted by decreasing score, as returned by search_top_k.
+    :param relevant_documents: set of the IDs of the relevant documents.
+    :param cutoffs: tuple of int ranks of the precisions P@k.
+    :param ndcg_depth: int rank of the nDCG.
+    :return: dict of the average precision, the P@k, the R-precision, the nDCG, the precision and recall of the whole
+    ranking and the interpolated precision at the recall_levels.
+    """
+    relevant_count = len(relevant_documents)
+    found_count = 0
+    precisions_sum = 0.0
+    dcg = 0.0
+    precisions_at = {}
+    r_precision = None
+    points = []  # (recall, precision) at each relevant document.
+    for rank, (doc_id, _) in enumerate(ranking, 1):
+        if doc_id in relevant_documents:
+            found_count += 1
+            precisions_sum += found_count / rank
+            points.append((found_count / relevant_count, found_count / rank))
+            if rank <= ndcg_depth:
+                dcg += 1 / log2(rank + 1)
+        if rank in cutoffs:
+            precisions_at[rank] = found_count / rank
+        if rank == relevant_count:
+            r_precision = found_count / relevant_count
+    # The ranks after the end of a short ranking count as non relevant documents.
+    for cutoff in cutoffs:
+        precisions_at.setdefault(cutoff, found_count / cutoff)
+    if r_precision is None:
+        r_precision = found_count / relevant_count
+    ideal_dcg = sum(1 / log2(rank + 1) for rank in range(1, min(relevant_count, ndcg_depth) + 1))
+    measures = {'average_precision': precisions_sum / relevant_count}
+    measures.update(('P@{}'.format(cutoff), precisions_at[cutoff]) for cutoff in cutoffs)
+    measures['R-precision'] = r_precision
+    measures['nDCG@{}'.format(ndcg_depth)] = dcg / ideal_dcg
+    measures['precision'] = found_count / len(ranking) if ranking else 0
+    measures['recall'] = found_count / relevant_count
+    # The interpolated precision at a recall level is the best precision at this recall or above.
+    interpolated = []
+    best_precision = 0
+    for recall, precision in reversed(points):
+        best_precision = max(best_precision, precision)
+        interpolated.append((recall, best_precision))
+    interpolated.reverse()
+    measures['interpolated_precision'] = [
+        next((precision for recall, precision in interpolated if recall >= level), 0) for level in recall_levels
+    ]
+    return measures
+
+
+class TestCollection:
+    """
+    Test queries of the collection with their relevant documents, to evaluate the ranked search.
+    """
+
+    def __init__(self, queries_path, relations_path):
+        """
+        Read the test queries and their relevant documents.
+        :param queries_path: str representing the path of the queries file (query.text).
+        :param relations_path: str representing the path of the relevance judgments file (qrels.text).
+        """
+        self.queries = self.read_queries(queries_path)  # Query number -> text of the query.
+        self.relations = {}  # Query number -> set of the IDs of its relevant documents.
+        with open(relations_path) as qrels_text:
+            for line in qrels_text:
+                query_id, doc_id = line.split()[:2]
+                self.relations.setdefault(int(query_id), set()).add(int(doc_id))
+
+    @staticmethod
+    def read_queries(path):
+        """
+        Read a queries file.
+        :param path: str representing the path of the queries file (query.text).
+        :return: dict of the queries numbers and texts.
+        """
+        queries = {}
+        with open(path) as query_text:
+            numbered_texts = re.split(r'^\.I (\d+)', query_text.read(), flags=re.MULTILINE)[1:]
+        for query_id, query_text in zip(numbered_texts[::2], numbered_texts[1::2]):
+            query = re.search(r'(?<=\.W\n).+(?=\n\.[AN])', query_text, re.DOTALL).group(0).strip().replace('\n', ' ')
+            queries[int(query_id)] = query
+        return queries
+
+    def evaluate(self, inverse_file_reader, models=('inner_product', 'dice', 'cos', 'jaccard'), depth=1000,
+                 processes=1, chunk_size=8, progress=None):
+        """
+        Compute the mean ranked measures of vector or probabilistic models over the queries having relevant documents.
+        Each query is searched for its depth best documents only (see InverseFileReader.search_top_k), and each
+        ranking is measured in one pass (see ranked_measures). With several processes, chunks of queries are evaluated
+        in parallel, each worker mapping the inverse file. The workers are spawned rather than forked, since the caller
+        may be a thread of a multi-threaded process, such as the GUI.
+        :param inverse_file_reader: InverseFileReader instance.
+        :param models: iterable of str representing the models, see InverseFileReader.search_query_vector.
+        :param depth: int number of documents retrieved for each query.
+        :param processes: int number of worker processes, None for one per core.
+        :param chunk_size: int number of queries evaluated at a time.
+        :param progress: function called with the number of queries evaluated and their total after each chunk.
+        :return: dict of the models and their dicts of measures: the means over the queries of those returned by
+        ranked_measures, the mean average precision being named 'MAP'.
+        """
+        queries_ids = [query_id for query_id in self.queries if query_id in self.relations]
+        chunks = [
+            [(self.queries[query_id], self.relations[query_id]) for query_id in queries_ids[start:start + chunk_size]]
+            for start in range(0, len(queries_ids), chunk_size)
+        ]
+        chunks_measures = [None] * len(chunks)
+        evaluated_count = 0
+        if processes == 1:
+            for index, chunk in enumerate(chunks):
+                chunks_measures[index] = self.evaluate_queries(inverse_file_reader, chunk, models, depth)
+                evaluated_count += len(chunk)
+                if progress is not None:
+                    progress(evaluated_count, len(queries_ids))
+        else:
+            with ProcessPoolExecutor(processes, mp_context=get_context('spawn')) as pool:
+                futures = {
+                    pool.submit(TestCollection.evaluate_chunk, inverse_file_reader.filepath,
+                                QueryPreprocessing.stop_list, ProbabilisticScorer.parameters(), chunk, models,
+                                depth): index
+                    for index, chunk in enumerate(chunks)
+                }
+                for future in as_completed(futures):
+                    chunks_measures[futures[future]] = future.result()
+                    evaluated_count += len(chunks[futures[future]])
+                    if progress is not None:
+                        progress(evaluated_count, len(queries_ids))
+        queries_measures = [measures for chunk_measures in chunks_measures for measures in chunk_measures]
+        evaluation = {}
+        for model in models:
+            model_measures = [measures[model] for measures in queries_measures]
+            evaluation[model] = {}
+            for name in model_measures[0]:
+                values = [measures[name] for measures in model_measures]
+                if name == 'interpolated_precision':
+                    mean = [statistics.mean(level_values) for level_values in zip(*values)]
+                else:
+                    mean = statistics.mean(values)
+                evaluation[model]['MAP' if name == 'average_precision' else name] = mean
+        return evaluation
+
+    @staticmethod
+    def evaluate_chunk(inverse_file_path, stop_list, parameters, queries, models, depth):
+        """
+        Worker task: evaluate a chunk of queries, see evaluate_queries.
+        """
+        QueryPreprocessing.set_stop_list(stop_list)
+        ProbabilisticScorer.k1, ProbabilisticScorer.b, ProbabilisticScorer.mu = parameters
+        return TestCollection.evaluate_queries(InverseFileReader(inverse_file_path), queries, models, depth)
+
+    @staticmethod
+    def evaluate_queries(inverse_file_reader, queries, models, depth):
+        """
+        Measure the rankings of each query. The rankings of the vector models are derived from a single accumulation of
+        the query (see InverseFileReader.search_query_models), the probabilistic models are searched one by one.
+        :param inverse_file_reader: InverseFileReader instance.
+        :param queries: list of tuples of a query and the set of IDs of its relevant documents.
+        :param models: iterable of str representing the models.
+        :param depth: int number of documents retrieved for each query.
+        :return: list of dicts of the models and their measures, see ranked_measures, one for each query.
+        """
+        vector_models = [model for model in models if model in InverseFileReader.vector_models]
+        queries_measures = []
+        for query, relevant_documents in queries:
+            rankings = inverse_file_reader.search_query_models(query, vector_models, depth) if vector_models else {}
+            for model in models:
+                if model not in rankings:
+                    rankings[model] = inverse_file_reader.search_query_vector(query, model, depth)
+            queries_measures.append({model: ranked_measures(rankings[model], relevant_documents) for model in models})
+        return queries_measures
@@ -0,0 +1,95 @@
+"""
+Load generator replaying the test queries (query.text) against the search server, printing the latencies as JSON.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from itertools import cycle, islice
+from os.path import join, dirname
+from urllib.parse import urlencode
+
+from evaluation import TestCollection
+from server import percentile
+
+query_default_path = join(dirname(__file__), 'cacm', 'query.text')
+
+
+async def request(reader, writer, host, target):
+    """
+    Send a GET request on a kept-alive connection.
+    :return: tuple of the int status and the JSON response.
+    """
+    writer.write('GET {} HTTP/1.1\r\nHost: {}\r\n\r\n'.format(target, host).encode('latin-1'))
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return status, json.loads(await reader.readexactly(int(headers['content-length'])))
+
+
+async def client(host, port, targets, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for target in targets:  # Shared iterator: each client takes the next query.
+            start = time.perf_counter()
+            status, _ = await request(reader, writer, host, target)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def replay(host, port, queries, model, k, requests_count, concurrency):
+    targets = ['/search?' + urlencode({'q': query, 'model': model, 'k': k}) for query in queries]
+    targets = islice(cycle(targets), requests_count)
+    latencies, errors = [], []
+    start = time.perf_counter()
+    await asyncio.gather(*(client(host, port, targets, latencies, errors) for _ in range(concurrency)))
+    end = time.perf_counter()
+    reader, writer = await asyncio.open_connection(host, port)
+    _, server_stats = await request(reader, writer, host, '/stats')
+    writer.close()
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'concurrency': concurrency,
+        'seconds': end - start,
+        'qps': len(latencies) / (end - start),
+        'p50_ms': percentile(latencies, 0.5) * 1000 if latencies else None,
+        'p99_ms': percentile(latencies, 0.99) * 1000 if latencies else None,
+        'server': server_stats,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--queries', default=query_default_path, help='test queries file')
+    parser.add_argument('--model', default='cos',
+                        choices=('inner_product', 'dice', 'cos', 'jaccard', 'bm25', 'dirichlet', 'matching_score'))
+    parser.add_argument('-k', type=int, default=10, help='number of documents of the ranked searches')
+    parser.add_argument('--requests', type=int, default=1000, help='number of requests sent')
+    parser.add_argument('--concurrency', type=int, default=8, help='number of clients sending requests together')
+    arguments = parser.parse_args(argv)
+    queries = list(TestCollection.read_queries(arguments.queries).values())
+    try:
+        report = asyncio.run(replay(arguments.host, arguments.port, queries, arguments.model, arguments.k,
+                                    arguments.requests, arguments.concurrency))
+    except OSError as err:
+        parser.exit(1, '{}\n'.format(err))
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
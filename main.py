@@ -1,312 +1,154 @@
 import sys
 import time
-import collections.abc
-import re
-import pickle
-import statistics
-from collections import Counter
-from math import log10
+from functools import partial
+from operator import itemgetter
 from os.path import join, dirname, isfile
-from PyQt4.QtGui import QMainWindow, QApplication, QTableWidgetItem, QFileDialog, QDialog
-from PyQt4.QtCore import QThread
+from PyQt4.QtGui import QMainWindow, QApplication, QFileDialog, QDialog
+from PyQt4.QtCore import (QThread, pyqtSignal, QAbstractTableModel, QModelIndex, Qt, QObject, QRunnable, QThreadPool,
+                          QTimer)
 from MainWindow import Ui_MainWindow
 from DocumentPropertiesDialog import Ui_DocumentDialog
 from InverseFileResultsDialog import Ui_InverseFileResultsDialog
+from core import CACMParser, InverseFileWriter, TfIdfFileWriter, DocumentStore, DeltaSegment, InverseFileReader, \
+    QueryPreprocessing
+from evaluation import TestCollection
 
 
-class CACMDocument:
+class TaskCancelled(Exception):
     """
-    Represent a single CACM document with an ID, title and a summary.
+    Raised in a task which was superseded by a newer one, to stop it.
     """
 
-    def __init__(self, num, title, summary):
-        self.I = num
-        self.T = title
-        self.W = summary
 
-    def __str__(self):
-        return str(self.I) + '/ ' + self.T + '\n' + self.W
-
-    def get_title(self):
-        return self.T
-
-    def get_document_number(self):
-        return self.I
+class Task(QRunnable):
+    """
+    Function run by a thread pool, out of the GUI thread. Its progress messages, its result and its exception are sent
+    by the signals, which Qt delivers in the GUI thread.
+    The function is called with the task followed by its arguments, and may call report to show its progress, which
+    also stops it when the task was cancelled. A task cancelled before it starts is not run.
+    """
 
-    def get_summary(self):
-        return self.W
+    class Signals(QObject):
+        progress = pyqtSignal(str)
+        done = pyqtSignal(object)  # Tuple returned by the function.
+        failed = pyqtSignal(object)  # Exception raised by the function.
 
+    def __init__(self, function, *arguments):
+        super().__init__()
+        self.function = function
+        self.arguments = arguments
+        self.signals = Task.Signals()
+        self.cancelled = False
 
-class InverseFileWriter:
-    """
-    Pickle based writer for an inverse file.
-    """
+    def cancel(self):
+        self.cancelled = True
 
-    def __init__(self, cacm, inverse_file_name):
+    def report(self, message):
         """
-        Generate an inverse file from a CACM reader.
-        :param cacm: CACMParser instance.
-        :param inverse_file_name: str representing the path of the inverse file.
+        Send a progress message.
+        :raise TaskCancelled: if the task was cancelled.
         """
-        self.inv_filename = inverse_file_name
-        words_documents_frequencies = {}
-        for document in cacm:
-            document_words = self.document_frequencies(document)
-            for word, frequency in document_words.items():
-                if word not in words_documents_frequencies.keys():
-                    words_documents_frequencies[word] = {}
-                try:
-                    words_documents_frequencies[word][document.get_document_number()] += frequency
-                except KeyError:
-                    words_documents_frequencies[word][document.get_document_number()] = frequency
-        if self.inv_filename !="" :
-            with open(self.inv_filename, "wb") as file:
-                pickle.dump(words_documents_frequencies, file)
-        else:
-            self.to_return_inv_file = words_documents_frequencies
+        if self.cancelled:
+            raise TaskCancelled()
+        self.signals.progress.emit(message)
+
+    def run(self):
+        if self.cancelled:
+            return
+        try:
+            result = self.function(self, *self.arguments)
+        except TaskCancelled:
+            return
+        except Exception as err:
+            self.signals.failed.emit(err)
+            return
+        self.signals.done.emit(result)
 
-    def get_InverseFile(self):
-        return self.to_return_inv_file
 
-    @staticmethod
-    def document_frequencies(cacmElem):
-        normalized_title = QueryPreprocessing.normalize_simple(cacmElem.get_title())
-        normalized_summary = QueryPreprocessing.normalize_simple(cacmElem.get_summary())
-        all_text = normalized_title + ' ' + normalized_summary
-        return Counter(QueryPreprocessing.tokenize_simple(all_text))
-
-
-class TfIdfFileWriter:
-
-    def __init__(self, cacm, TfIdf_name):
-        self.cacm2 = CACMParser(cacm)
-        self.cacm3 = CACMParser(cacm)
-        self.nember_docs = len(list(self.cacm3))
-        self.docs_words_frequencies = InverseFileWriter(self.cacm2,"").get_InverseFile()
-        self.Idf_filename = TfIdf_name
-        d = {}
-        for term in self.docs_words_frequencies.keys():
-            d[term] = {}
-            for doc in self.docs_words_frequencies[term]:
-                d[term][doc] = self.docs_words_frequencies[term][doc]/max(self.docs_words_frequencies[term].values()) * log10(self.nember_docs/len(self.docs_words_frequencies[term])+1)
-        with open(self.Idf_filename, "wb") as file:
-            pickle.dump(d, file)
-
-
-class CACMParser(collections.abc.Iterator):
+class TaskParser(CACMParser):
     """
-    Iterator which returns a CACMDocument on each call.
+    Collection parser reporting to a task the share of the file parsed, and so stopping when the task is cancelled.
     """
 
-    def __init__(self, filepath):
-        self.filepath = filepath
-        with open(filepath) as f:
-            file_content = f.read()
-        self.documents = re.split(r'^\.I', file_content, flags=re.MULTILINE)[1:]
+    def __init__(self, filepath, task, message):
+        """
+        :param filepath: str representing the path of the collection file.
+        :param task: Task instance.
+        :param message: str progress message, formatted with the percentage parsed.
+        """
+        super().__init__(filepath)
+        self.task = task
+        self.message = message
+        self.percent = None
 
     def __next__(self):
-        try:
-            doc = self.documents.pop(0)
-        except IndexError:
-            raise StopIteration
-        num_rest = doc.split('.T')
-        I = int(num_rest[0])
-        rest = num_rest[1].split('.B')
-        title_summary = rest[0].split('.W')
-        T = title_summary[0].strip(' \n').replace('\n', ' ')
-        if len(title_summary) == 2:
-            W = title_summary[1].strip(' \n').replace('\n', ' ')
-        else:
-            W = ''
-        return CACMDocument(I, T, W)
+        percent = self.position * 100 // max(1, len(self.mapping))
+        if percent != self.percent:
+            self.percent = percent
+            self.task.report(self.message.format(percent))
+        return super().__next__()
 
-    def __iter__(self):
-        return self
 
-
-class InverseFileReader:
+class ResultsTableModel(QAbstractTableModel):
     """
-    Pickle based reader for an inverse file.
+    Read-only table model over a list of result rows, such as (document, score) tuples.
+    The view is told of the rows by batches, as it scrolls down to them, and asks only for the visible ones, so showing
+    thousands of results costs about as much as showing a few. The rows are sorted in the list itself.
     """
 
-    def __init__(self, filepath):
-        """
-        Load the inverse file.
-        :param filepath: str representing the path of the inverse file.
-        """
-        self.docs_words_frequencies = {}
-        with open(filepath, 'rb') as inv_file:
-            words_docs_frequencies = pickle.load(inv_file)
-            for word in words_docs_frequencies.keys():
-                for doc_id, frequency in words_docs_frequencies[word].items():
-                    if doc_id not in self.docs_words_frequencies.keys():
-                        self.docs_words_frequencies[doc_id] = {}
-                    try:
-                        self.docs_words_frequencies[doc_id][word] += frequency
-                    except KeyError:
-                        self.docs_words_frequencies[doc_id][word] = frequency
-        self.word_regexp = re.compile(r'\b\w+\b')
-        self.test_queries = []
-        self.test_relations = []
-
-    def get_documents_count(self):  # Number of documents in the inverse file.
-        return len(self.docs_words_frequencies)
-
-    def get_words_count(self):  # Number of words in the inverse file.
-        return len(set(word for words_frequencies in self.docs_words_frequencies.values() for word in words_frequencies.keys()))
-
-    def __len__(self):
-        return self.get_words_count()
-
-    def get_document_words_frequencies(self, document_id):
-        """
-        Return a dict containing the words of a document with their frequencies.
-        :param document_id: int representing ID of the document.
-        :return: dict of words as keys and their frequencies as values in the selected document.
-        """
-        assert isinstance(document_id, int)
-        return self.docs_words_frequencies[document_id]
-
-    def get_word_documents_frequencies(self, word):
-        """
-        Return a dict containing the frequencies of the word in each document.
-        :param word: str representing the word.
-        :return: dict of document IDs (int) as keys and the frequencies (float) as values.
-        """
-        assert isinstance(word, str)
-        docs = {}
-        for doc_id in self.docs_words_frequencies.keys():
-            try:
-                docs[doc_id] = self.docs_words_frequencies[doc_id][word]
-            except KeyError:
-                pass
-        return docs
+    fetch_size = 256  # Number of rows added to the view at a time.
 
-    def search_query_matching_score(self, query):
-        """
-        Return a dict containing the matching score of each relevant document.
-        :param query: str of words.
-        :return: dict which its keys are the IDs of the documents and its values are the relevance of each document.
+    def __init__(self, headers, parent=None):
         """
-        assert isinstance(query, str)
-        docs_relevance = {}
-        for word in QueryPreprocessing.tokenize_simple(QueryPreprocessing.normalize_simple(query)):
-            word_frequencies = self.get_word_documents_frequencies(word)
-            for doc_id in word_frequencies.keys():
-                try:
-                    docs_relevance[doc_id] += word_frequencies[doc_id]
-                except KeyError:
-                    docs_relevance[doc_id] = word_frequencies[doc_id]
-        return docs_relevance
-
-    def search_query_boolean(self, boolean_query):
+        :param headers: tuple of str titles of the columns.
+        :param parent: QObject.
         """
-        Return a list of IDs of the relevant documents to a boolean query using the boolean search model.
-        :param boolean_query: str representing the query.
-        :return: list of IDs of the relevant documents.
-        """
-        assert isinstance(boolean_query, str)  # Type checking
-        relevant_docs = []
-        for doc_id in self.docs_words_frequencies.keys():
-            relevant = eval(
-                QueryPreprocessing.replace_boolean_operators(
-                    re.sub(
-                        self.word_regexp,
-                        lambda word: str(word.group() in self.get_document_words_frequencies(doc_id)),
-                        QueryPreprocessing.normalize_boolean(boolean_query)
-                    )
-                )
-            )
-            if relevant:
-                relevant_docs.append(doc_id)
-        return relevant_docs
+        super().__init__(parent)
+        self.headers = headers
+        self.rows = []
+        self.fetched_count = 0  # Number of rows known to the view.
 
-    def search_query_vector(self, query, model):
+    def set_rows(self, rows):
         """
-        Return a dict of documents IDs with the corresponding similarities.
-        :param query: str representing the query.
-        :param model: str representing which vector model is used.
-        :return: dict whose its keys are the documents IDs and the values are the similarities.
+        Replace the rows of the table.
+        :param rows: list of tuples of one value for each column.
         """
-        assert isinstance(query, str)
-        assert model in ('inner_product', 'dice', 'cos', 'jaccard')
-        docs_relevance = {}
-        query_words = QueryPreprocessing.tokenize_simple(QueryPreprocessing.normalize_simple(query))
-        for doc_id in self.docs_words_frequencies.keys():
-            for word, frequency in self.get_document_words_frequencies(doc_id).items():
-                if word in query_words:
-                    try:
-                        docs_relevance[doc_id] += frequency
-                    except KeyError:
-                        docs_relevance[doc_id] = frequency
-        if model == 'dice':
-            for doc_id in docs_relevance.keys():
-                docs_relevance[doc_id] = 2 * docs_relevance[doc_id] / (
-                    len(query_words) + sum(p**2 for p in self.docs_words_frequencies[doc_id].values())
-                )
-        elif model == 'cos':
-            for doc_id in docs_relevance.keys():
-                docs_relevance[doc_id] /= (len(query_words) * sum(
-                    p**2 for p in self.docs_words_frequencies[doc_id].values()
-                ))**(1/2)
-        elif model == 'jaccard':
-            for doc_id in docs_relevance.keys():
-                docs_relevance[doc_id] /= len(query_words) + sum(
-                    p**2 for p in self.docs_words_frequencies[doc_id].values()
-                ) - docs_relevance[doc_id]
-        return docs_relevance
-
-
-class QueryPreprocessing:
-    """
-    Contain set of static methods for normalization and tokenizing
-    """
+        self.beginResetModel()
+        self.rows = rows
+        self.fetched_count = min(len(rows), self.fetch_size)
+        self.endResetModel()
 
-    eliminate_regexp = re.compile(r"[^\w'\s]+")
-    eliminate_boolean_regexp = re.compile(r"[^\w'&|~()]+")
-    token_simple_regexp = re.compile(r"\s+")
-    token_boolean_regexp = re.compile(r"\s+|([&|~()])")
-    stop_list = None
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.fetched_count
 
-    @staticmethod
-    def load_stop_list(path):
-        with open(path) as stop_file:
-            QueryPreprocessing.stop_list = set(w.rstrip('\r\n') for w in stop_file)
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
 
-    @staticmethod
-    def normalize_simple(query):
-        assert isinstance(query, str)
-        query = re.sub(QueryPreprocessing.eliminate_regexp, ' ', query.lower())
-        query = ' '.join(
-            w for w in QueryPreprocessing.tokenize_simple(query)
-            if w not in QueryPreprocessing.stop_list
-        )
-        return query
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        return str(self.rows[index.row()][index.column()])
 
-    @staticmethod
-    def normalize_boolean(query):
-        assert isinstance(query, str)
-        query = re.sub(QueryPreprocessing.eliminate_boolean_regexp, ' ', query.lower())
-        query = ' '.join(
-            w for w in QueryPreprocessing.tokenize_boolean(query)
-            if w not in QueryPreprocessing.stop_list
-        )
-        return query
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        return self.headers[section] if orientation == Qt.Horizontal else str(section + 1)
 
-    @staticmethod
-    def tokenize_simple(query):
-        assert isinstance(query, str)
-        return [w for w in re.split(QueryPreprocessing.token_simple_regexp, query) if w]
+    def canFetchMore(self, parent):
+        return not parent.isValid() and self.fetched_count < len(self.rows)
 
-    @staticmethod
-    def tokenize_boolean(query):
-        assert isinstance(query, str)
-        return [w for w in re.split(QueryPreprocessing.token_boolean_regexp, query) if w]
+    def fetchMore(self, parent):
+        count = min(self.fetch_size, len(self.rows) - self.fetched_count)
+        self.beginInsertRows(QModelIndex(), self.fetched_count, self.fetched_count + count - 1)
+        self.fetched_count += count
+        self.endInsertRows()
 
-    @staticmethod
-    def replace_boolean_operators(boolean_query):
-        assert isinstance(boolean_query, str)
-        return boolean_query.replace('&', ' and ').replace('|', ' or ').replace('~', ' not ')
+    def sort(self, column, order=Qt.AscendingOrder):
+        if column < 0:  # Sort indicator cleared: the rows keep their order.
+            return
+        self.layoutAboutToBeChanged.emit()
+        self.rows.sort(key=itemgetter(column), reverse=order == Qt.DescendingOrder)
+        self.layoutChanged.emit()
 
 
 class MainWindow(QMainWindow, Ui_MainWindow):
@@ -315,12 +157,23 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         super().__init__()
         self.setupUi(self)
         self.inverse_file_reader = None
+        self.document_store = None
+        self.test_collection = None
+        self.max_results = 1000  # Number of documents listed by the ranked searches.
         self.inv_msg_time = 5000  # ms
         self.inv_default_path = 'inverse.bin'
         self.cacm_all_default_path = join(dirname(__file__), 'cacm', 'cacm.all')
         self.common_words_default_path = join(dirname(__file__), 'cacm', 'common_words')
         self.query_default_path = join(dirname(__file__), 'cacm', 'query.text')
         self.qrels_default_path = join(dirname(__file__), 'cacm', 'qrels.text')
+        self.thread_pool = QThreadPool(self)
+        self.thread_pool.setMaxThreadCount(max(2, QThread.idealThreadCount()))
+        self.tasks = {}  # Kind of task -> latest task of that kind, whose result is still to be applied.
+        # The inverse file is loaded once its path has not been edited for a moment.
+        self.load_timer = QTimer(self)
+        self.load_timer.setSingleShot(True)
+        self.load_timer.setInterval(300)  # ms
+        self.load_timer.timeout.connect(self.load_inverse_file)
 
         self.clearResultsPushButton.clicked.connect(self.clear_results)
 
@@ -330,7 +183,7 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 
         self.cacmAllFileLineEdit.textChanged.connect(self.check_cacm_all)
         self.commonWordsFileLineEdit.textChanged.connect(self.check_common_words)
-        self.loadInverseFileLineEdit.textChanged.connect(self.load_inverse_file)
+        self.loadInverseFileLineEdit.textChanged.connect(lambda: self.load_timer.start())
         self.loadInveseFilePushButton.clicked.connect(self.choose_load_inverse_file)
         self.loadInverseFileSearchWordPushButton.clicked.connect(self.find_word_inverse_file)
         self.loadInverseFileSearchDocumentPushButton.clicked.connect(self.find_document_inverse_file)
@@ -341,9 +194,10 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         self.qrelsFileLineEdit.textChanged.connect(self.check_qrels)
         self.precisionRecallPushButton.clicked.connect(self.calculate_precision_recall)
 
-        self.resultsTableWidget.itemDoubleClicked.connect(self.show_document)
+        self.results_model = ResultsTableModel(('Document', 'Score'), self)
+        self.resultsTableView.setModel(self.results_model)
+        self.resultsTableView.doubleClicked.connect(self.show_document)
 
-        self.resultsTableWidget.setColumnCount(2)
         self.cacmAllFileLineEdit.setText(self.cacm_all_default_path)
         self.commonWordsFileLineEdit.setText(self.common_words_default_path)
         self.qrelsFileLineEdit.setText(self.qrels_default_path)
@@ -351,10 +205,90 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         self.loadInverseFileLineEdit.setText(self.inv_default_path)
         self.saveInverseFileLineEdit.setText(self.inv_default_path)
 
+    def start_task(self, kind, function, arguments, on_done, on_failed):
+        """
+        Run a function in the thread pool, see Task. The previous task of the same kind is cancelled: it stops, or is
+        not run, and its result is ignored, so only the result of the latest task of each kind is applied.
+        :param kind: str kind of task.
+        :param function: function of the task, returning a tuple of the arguments of on_done.
+        :param arguments: tuple of the arguments of the function, after the task.
+        :param on_done: function applying the result in the GUI thread.
+        :param on_failed: function called in the GUI thread with the exception raised by the function.
+        """
+        self.cancel_task(kind)
+        task = Task(function, *arguments)
+        self.tasks[kind] = task
+        task.signals.progress.connect(partial(self.show_task_progress, kind, task))
+        task.signals.done.connect(partial(self.finish_task, kind, task, lambda result: on_done(*result)))
+        task.signals.failed.connect(partial(self.finish_task, kind, task, on_failed))
+        self.thread_pool.start(task)
+
+    def cancel_task(self, kind):
+        task = self.tasks.pop(kind, None)
+        if task is not None:
+            task.cancel()
+
+    def show_task_progress(self, kind, task, message):
+        if self.tasks.get(kind) is task:
+            self.statusbar.showMessage(message)
+
+    def finish_task(self, kind, task, function, value):
+        if self.tasks.get(kind) is not task:  # Superseded while its result was on its way.
+            return
+        del self.tasks[kind]
+        function(value)
+
     def clear_results(self):
-        self.resultsTableWidget.setRowCount(0)
+        self.cancel_task('search')
+        self.results_model.set_rows([])
         self.statusbar.clearMessage()
 
+    def show_results(self, results, seconds, limit=None):
+        """
+        List the results of a search, in their order, and show their number.
+        :param results: list of (document ID, score) tuples.
+        :param seconds: float duration of the search.
+        :param limit: int number of documents listed by a ranked search, which asks for one more to know whether
+        there are others.
+        """
+        if limit is not None and len(results) > limit:
+            results = results[:limit]
+            found = 'Plus de {0} documents trouvés, les {0} premiers sont listés.'.format(limit)
+        else:
+            found = '{} documents trouvés.'.format(len(results))
+        self.results_model.set_rows(results)
+        self.resultsTableView.horizontalHeader().setSortIndicator(-1, Qt.DescendingOrder)
+        self.resultsTableView.resizeColumnToContents(0)
+        self.statusbar.showMessage('{} Durée de la recherche : {}s'.format(found, round(seconds, 4)))
+
+    def search_failed(self, err):
+        if isinstance(err, ValueError):
+            self.statusbar.showMessage('La requête booléenne est invalide !')
+        else:
+            self.statusbar.showMessage('La recherche a échoué : {}'.format(err))
+
+    def start_search(self, search, *arguments, limit=None):
+        """
+        Run a search in the thread pool, cancelling the previous one. A search which has started cannot be stopped: a
+        superseded one runs to its end, and only its results are ignored.
+        :param search: function returning a list of (document ID, score) tuples.
+        :param arguments: arguments of the search.
+        :param limit: int number of documents listed, see show_results.
+        """
+        self.statusbar.showMessage('Recherche en cours...')
+        self.start_task('search', MainWindow.run_search, (search,) + arguments, partial(self.show_results, limit=limit),
+                        self.search_failed)
+
+    @staticmethod
+    def run_search(task, search, *arguments):  # Search task.
+        start = time.perf_counter()
+        results = search(*arguments)
+        return results, time.perf_counter() - start
+
+    @staticmethod
+    def search_boolean_results(inverse_file_reader, query):  # Documents of a boolean query, all with a score of 1.
+        return [(doc_id, 1) for doc_id in inverse_file_reader.search_query_boolean(query)]
+
     def search_vector(self):
         user_query = self.vectorSearchLineEdit.text()
         vector_similarity_function = 'inner_product'
@@ -364,53 +298,17 @@ class MainWindow(QMainWindow, Ui_MainWindow):
             vector_similarity_function = 'cos'
         elif self.jaccardRadioButton.isChecked():
             vector_similarity_function = 'jaccard'
-        start = time.perf_counter()
-        docs_frequencies = self.inverse_file_reader.search_query_vector(user_query, vector_similarity_function)
-        end = time.perf_counter()
-        self.clear_results()
-        last_index = 0
-        for doc_id in sorted(docs_frequencies.keys(), key=lambda x: docs_frequencies[x], reverse=True):
-            frequency = docs_frequencies[doc_id]
-            self.resultsTableWidget.insertRow(last_index)
-            self.resultsTableWidget.setItem(last_index, 0, QTableWidgetItem(str(doc_id)))
-            self.resultsTableWidget.setItem(last_index, 1, QTableWidgetItem(str(frequency)))
-            last_index += 1
-        self.resultsTableWidget.resizeColumnsToContents()
-        self.statusbar.showMessage('{} documents trouvés. Durée de la recherche : {}s'.format(last_index, round(end-start, 4)))
-        return docs_frequencies
+        self.start_search(self.inverse_file_reader.search_query_vector, user_query, vector_similarity_function,
+                          self.max_results + 1, limit=self.max_results)
 
     def search_boolean(self):
         user_query = self.booleanSearchLineEdit.text()
-        start = time.perf_counter()
-        docs = self.inverse_file_reader.search_query_boolean(user_query)
-        end = time.perf_counter()
-        self.clear_results()
-        last_index = 0
-        for doc_id in docs:
-            self.resultsTableWidget.insertRow(last_index)
-            self.resultsTableWidget.setItem(last_index, 0, QTableWidgetItem(str(doc_id)))
-            self.resultsTableWidget.setItem(last_index, 1, QTableWidgetItem(str(1)))
-            last_index += 1
-        self.resultsTableWidget.resizeColumnsToContents()
-        self.statusbar.showMessage('{} documents trouvés. Durée de la recherche : {}s'.format(last_index, round(end-start, 4)))
-        return docs
+        self.start_search(MainWindow.search_boolean_results, self.inverse_file_reader, user_query)
 
     def search_matching_score(self):
         user_query = self.matchingScoreSearchLineEdit.text()
-        start = time.perf_counter()
-        docs = self.inverse_file_reader.search_query_matching_score(user_query)
-        end = time.perf_counter()
-        self.clear_results()
-        last_index = 0
-        for doc_id in sorted(docs.keys(), key=lambda x: docs[x], reverse=True):
-            score = docs[doc_id]
-            self.resultsTableWidget.insertRow(last_index)
-            self.resultsTableWidget.setItem(last_index, 0, QTableWidgetItem(str(doc_id)))
-            self.resultsTableWidget.setItem(last_index, 1, QTableWidgetItem(str(score)))
-            last_index += 1
-        self.resultsTableWidget.resizeColumnsToContents()
-        self.statusbar.showMessage('{} documents trouvés. Durée de la recherche : {}s'.format(last_index, round(end-start, 4)))
-        return docs
+        self.start_search(self.inverse_file_reader.search_query_matching_score, user_query, self.max_results + 1,
+                          limit=self.max_results)
 
     def choose_load_inverse_file(self):
         file_path = QFileDialog.getOpenFileName(self)
@@ -418,24 +316,47 @@ class MainWindow(QMainWindow, Ui_MainWindow):
             self.loadInverseFileLineEdit.setText(file_path)
 
     def load_inverse_file(self):
-        font = self.loadInverseFileLineEdit.font()
+        self.statusbar.showMessage('Chargement du fichier inverse...')
+        self.start_task('load', MainWindow.open_inverse_file, (self.loadInverseFileLineEdit.text(),),
+                        self.inverse_file_loaded, self.inverse_file_failed)
+
+    @staticmethod
+    def open_inverse_file(task, path):
+        """
+        Loading task: open the inverse file, replaying its updates, then its document store. A superseded load stops
+        between the two, as the file itself is opened in a single step.
+        """
+        start = time.perf_counter()
+        inverse_file_reader = InverseFileReader(path)
+        end = time.perf_counter()
+        task.report('Chargement des documents...')
         try:
-            start = time.perf_counter()
-            self.inverse_file_reader = InverseFileReader(self.loadInverseFileLineEdit.text())
-            end = time.perf_counter()
-            self.searchTab.setEnabled(True)
-            font.setStrikeOut(False)
-            self.loadInverseFileSearchGroupBox.setEnabled(True)
-            self.statusbar.showMessage('Fichier inverse a été chargé en {}s'.format(round(end-start, 4)), self.inv_msg_time)
-            self.loadInverseFileSearchDocumentSpinBox.setMaximum(self.inverse_file_reader.get_documents_count())
-        except (pickle.PickleError, OSError) as err:
-            if isinstance(err, OSError):
-                self.statusbar.showMessage('Le fichier inverse spécifié n\'existe pas !')
-            else:
-                self.statusbar.showMessage('Le fichier inverse spécifié est invalide !')
-            self.loadInverseFileSearchGroupBox.setEnabled(False)
-            self.searchTab.setEnabled(False)
-            font.setStrikeOut(True)
+            document_store = DocumentStore(DocumentStore.path_for(path), log_path=DeltaSegment.path_for(path))
+        except (ValueError, OSError):  # No usable store: documents are looked up in the collection file.
+            document_store = None
+        return inverse_file_reader, document_store, end - start
+
+    def inverse_file_loaded(self, inverse_file_reader, document_store, seconds):
+        self.cancel_task('search')  # Its results would come from the previous inverse file.
+        self.inverse_file_reader = inverse_file_reader
+        self.document_store = document_store
+        self.searchTab.setEnabled(True)
+        font = self.loadInverseFileLineEdit.font()
+        font.setStrikeOut(False)
+        self.loadInverseFileLineEdit.setFont(font)
+        self.loadInverseFileSearchGroupBox.setEnabled(True)
+        self.statusbar.showMessage('Fichier inverse a été chargé en {}s'.format(round(seconds, 4)), self.inv_msg_time)
+        self.loadInverseFileSearchDocumentSpinBox.setMaximum(self.inverse_file_reader.get_documents_count())
+
+    def inverse_file_failed(self, err):
+        if isinstance(err, OSError):
+            self.statusbar.showMessage('Le fichier inverse spécifié n\'existe pas !')
+        else:
+            self.statusbar.showMessage('Le fichier inverse spécifié est invalide !')
+        self.loadInverseFileSearchGroupBox.setEnabled(False)
+        self.searchTab.setEnabled(False)
+        font = self.loadInverseFileLineEdit.font()
+        font.setStrikeOut(True)
         self.loadInverseFileLineEdit.setFont(font)
 
     def choose_save_inverse_file(self):
@@ -444,17 +365,35 @@ class MainWindow(QMainWindow, Ui_MainWindow):
             self.saveInverseFileLineEdit.setText(file_path)
 
     def generate_inverse_file(self):
-        try:
-            inverse_file_path = self.saveInverseFileLineEdit.text()
-            start = time.perf_counter()
-            if self.saveInverseFileTfIdfRadioButton.isChecked():
-                TfIdfFileWriter(self.cacmAllFileLineEdit.text(), inverse_file_path)
-            else:
-                InverseFileWriter(CACMParser(self.cacmAllFileLineEdit.text()), inverse_file_path)
-            end = time.perf_counter()
-            self.statusbar.showMessage('Fichier inverse a été sauvegardé en {}s'.format(round(end - start, 4)), self.inv_msg_time)
-        except OSError:
+        # Generations are not superseded: two writers of the same files would spoil each other.
+        if 'generate' in self.tasks:
+            self.statusbar.showMessage('Un fichier inverse est déjà en cours de génération !', self.inv_msg_time)
+            return
+        self.start_task('generate', MainWindow.write_inverse_file, (
+            self.cacmAllFileLineEdit.text(), self.saveInverseFileLineEdit.text(),
+            self.saveInverseFileTfIdfRadioButton.isChecked()
+        ), self.inverse_file_generated, self.inverse_file_generation_failed)
+
+    @staticmethod
+    def write_inverse_file(task, cacm_path, inverse_file_path, tf_idf):  # Generation task.
+        start = time.perf_counter()
+        cacm = TaskParser(cacm_path, task, 'Génération du fichier inverse... {}%')
+        if tf_idf:
+            TfIdfFileWriter(cacm, inverse_file_path)
+        else:
+            InverseFileWriter(cacm, inverse_file_path)
+        return inverse_file_path, time.perf_counter() - start
+
+    def inverse_file_generated(self, inverse_file_path, seconds):
+        self.statusbar.showMessage('Fichier inverse a été sauvegardé en {}s'.format(round(seconds, 4)), self.inv_msg_time)
+        if inverse_file_path == self.loadInverseFileLineEdit.text():  # The loaded file was replaced.
+            self.load_timer.start()
+
+    def inverse_file_generation_failed(self, err):
+        if isinstance(err, OSError):
             self.statusbar.showMessage('Le fichier inverse ne peut pas être sauvegardé dans le chemin spécifié !')
+        else:
+            self.statusbar.showMessage('La génération du fichier inverse a échoué : {}'.format(err))
 
     def check_file(self, path):
         if not isfile(path):
@@ -501,144 +440,85 @@ class MainWindow(QMainWindow, Ui_MainWindow):
             super(MainWindow.DocumentPropertiesDialog, self).__init__(parent)
             self.setupUi(self)
 
-    def show_document(self, item):
-        assert isinstance(item, QTableWidgetItem)
-        if item.column() == 0:
-            doc_id = int(item.text())
-        else:
-            doc_id = int(item.tableWidget().item(item.row(), 0).text())
+    def show_document(self, index):
+        doc_id = self.results_model.rows[index.row()][0]
         dialog = MainWindow.DocumentPropertiesDialog(self)
         dialog.documentNumberLineEdit.setText(str(doc_id))
         dialog.show()
-        for cacm in CACMParser(self.cacmAllFileLineEdit.text()):  # Not efficient, but saves some memory.
-            if cacm.get_document_number() == doc_id:
-                dialog.documentTitleLineEdit.setText(cacm.get_title())
-                dialog.documentSummaryPlainTextEdit.setPlainText(cacm.get_summary())
-                break
+        cacm = None
+        if self.document_store is not None:
+            try:
+                cacm = self.document_store.get_document(doc_id)
+            except KeyError:  # Outdated store.
+                pass
+        if cacm is None:  # Not efficient, but saves some memory.
+            cacm = next((cacm for cacm in CACMParser(self.cacmAllFileLineEdit.text())
+                         if cacm.get_document_number() == doc_id), None)
+        if cacm is not None:
+            dialog.documentTitleLineEdit.setText(cacm.get_title())
+            dialog.documentSummaryPlainTextEdit.setPlainText(cacm.get_summary())
 
     class ResultsDialog(QDialog, Ui_InverseFileResultsDialog):
 
         def __init__(self, parent=None):
             super(MainWindow.ResultsDialog, self).__init__(parent)
             self.setupUi(self)
+            self.results_model = ResultsTableModel(('Objet', 'Poids'), self)
+            self.inverseFileResultsTableView.setModel(self.results_model)
 
     def find_word_inverse_file(self):
         word = self.loadInverseFileSearchWordLineEdit.text().lower()
         docs_frequencies = self.inverse_file_reader.get_word_documents_frequencies(word)
         results_dialog = MainWindow.ResultsDialog(self)
-        results_dialog.inverseFileResultsTableWidget.setRowCount(len(docs_frequencies))
-        last = 0
-        for doc_id, frequency in docs_frequencies.items():
-            results_dialog.inverseFileResultsTableWidget.setItem(last, 0, QTableWidgetItem(str(doc_id)))
-            results_dialog.inverseFileResultsTableWidget.setItem(last, 1, QTableWidgetItem(str(frequency)))
-            last += 1
-        results_dialog.inverseFileResultsTableWidget.resizeColumnsToContents()
+        results_dialog.results_model.set_rows(list(docs_frequencies.items()))
+        results_dialog.inverseFileResultsTableView.resizeColumnToContents(0)
         results_dialog.show()
 
     def find_document_inverse_file(self):
         doc_id = self.loadInverseFileSearchDocumentSpinBox.value()
         words_frequencies = self.inverse_file_reader.get_document_words_frequencies(doc_id)
         results_dialog = MainWindow.ResultsDialog(self)
-        results_dialog.inverseFileResultsTableWidget.setRowCount(len(words_frequencies))
-        last = 0
-        for word, frequency in words_frequencies.items():
-            results_dialog.inverseFileResultsTableWidget.setItem(last, 0, QTableWidgetItem(str(word)))
-            results_dialog.inverseFileResultsTableWidget.setItem(last, 1, QTableWidgetItem(str(frequency)))
-            last += 1
+        results_dialog.results_model.set_rows(list(words_frequencies.items()))
         results_dialog.show()
 
-    def load_test_queries(self, path):
-        if self.check_query(path):
-            with open(path) as query_text:
-                self.inverse_file_reader.test_queries = []
-                file_content = query_text.read()
-                for doc_text in re.split('\.I \d+', file_content)[1:]:
-                    query = re.search('(?<=\.W\n).+(?=\n\.[AN])', doc_text, re.DOTALL).group(0).strip().replace('\n', ' ')
-                    self.inverse_file_reader.test_queries.append(query)
-                return True
-        return False
-
-    def load_query_relations(self, path):
-        if self.check_qrels(path):
-            with open(path) as qrels_text:
-                self.inverse_file_reader.test_relations = []
-                for line in qrels_text:
-                    query_id, doc_id = line.strip().split(' ')[:2]
-                    try:
-                        self.inverse_file_reader.test_relations[int(query_id)-1].add(int(doc_id))
-                    except IndexError:
-                        self.inverse_file_reader.test_relations.append({int(doc_id)})
-                return True
-        return False
-
     class PrecisionRecallThread(QThread):
 
+        progress = pyqtSignal(int, int)  # Number of queries evaluated and their total.
+
         def __init__(self, parent=None):
             super(MainWindow.PrecisionRecallThread, self).__init__(parent)
 
         def run(self):
-
-            precisions = []
-            recalls = []
-            for i in range(len(self.parent().inverse_file_reader.test_queries)):
-                results = set(self.parent().inverse_file_reader.search_query_vector(
-                    self.parent().inverse_file_reader.test_queries[i], 'inner_product').keys()
-                )
-                correct_documents_count = len(results & self.parent().inverse_file_reader.test_relations[i])
-                precisions.append(correct_documents_count / len(results))
-                recalls.append(correct_documents_count / len(self.parent().inverse_file_reader.test_relations[i]))
-            avg_precision = statistics.mean(precisions)
-            avg_recall = statistics.mean(recalls)
-            self.parent().innerProductPrecisionLineEdit.setText(str(avg_precision))
-            self.parent().innerProductRecallLineEdit.setText(str(avg_recall))
-
-            precisions = []
-            recalls = []
-            for i in range(len(self.parent().inverse_file_reader.test_queries)):
-                results = set(self.parent().inverse_file_reader.search_query_vector(
-                    self.parent().inverse_file_reader.test_queries[i], 'dice').keys()
-                )
-                correct_documents_count = len(results & self.parent().inverse_file_reader.test_relations[i])
-                precisions.append(correct_documents_count / len(results))
-                recalls.append(correct_documents_count / len(self.parent().inverse_file_reader.test_relations[i]))
-            avg_precision = statistics.mean(precisions)
-            avg_recall = statistics.mean(recalls)
-            self.parent().dicePrecisionLineEdit.setText(str(avg_precision))
-            self.parent().diceRecallLineEdit.setText(str(avg_recall))
-
-            precisions = []
-            recalls = []
-            for i in range(len(self.parent().inverse_file_reader.test_queries)):
-                results = set(self.parent().inverse_file_reader.search_query_vector(
-                    self.parent().inverse_file_reader.test_queries[i], 'cos').keys()
-                )
-                correct_documents_count = len(results & self.parent().inverse_file_reader.test_relations[i])
-                precisions.append(correct_documents_count / len(results))
-                recalls.append(correct_documents_count / len(self.parent().inverse_file_reader.test_relations[i]))
-            avg_precision = statistics.mean(precisions)
-            avg_recall = statistics.mean(recalls)
-            self.parent().cosPrecisionLineEdit.setText(str(avg_precision))
-            self.parent().cosRecallLineEdit.setText(str(avg_recall))
-
-            precisions = []
-            recalls = []
-            for i in range(len(self.parent().inverse_file_reader.test_queries)):
-                results = set(self.parent().inverse_file_reader.search_query_vector(
-                    self.parent().inverse_file_reader.test_queries[i], 'jaccard').keys()
+            window = self.parent()
+            # The queries are shared among one process per core, each retrieving its best documents only.
+            evaluation = window.test_collection.evaluate(
+                window.inverse_file_reader, depth=window.max_results, processes=None, progress=self.progress.emit
+            )
+            for model, precision_line_edit, recall_line_edit in (
+                ('inner_product', window.innerProductPrecisionLineEdit, window.innerProductRecallLineEdit),
+                ('dice', window.dicePrecisionLineEdit, window.diceRecallLineEdit),
+                ('cos', window.cosPrecisionLineEdit, window.cosRecallLineEdit),
+                ('jaccard', window.jaccardPrecisionLineEdit, window.jaccardRecallLineEdit),
+            ):
+                measures = evaluation[model]
+                precision_line_edit.setText(str(measures['precision']))
+                recall_line_edit.setText(str(measures['recall']))
+                ranked_measures = '\n'.join(
+                    '{} : {}'.format(name, round(value, 4)) for name, value in measures.items()
+                    if name not in ('precision', 'recall', 'interpolated_precision')
                 )
-                correct_documents_count = len(results & self.parent().inverse_file_reader.test_relations[i])
-                precisions.append(correct_documents_count / len(results))
-                recalls.append(correct_documents_count / len(self.parent().inverse_file_reader.test_relations[i]))
-            avg_precision = statistics.mean(precisions)
-            avg_recall = statistics.mean(recalls)
-            self.parent().jaccardPrecisionLineEdit.setText(str(avg_precision))
-            self.parent().jaccardRecallLineEdit.setText(str(avg_recall))
+                precision_line_edit.setToolTip(ranked_measures)
+                recall_line_edit.setToolTip(ranked_measures)
 
     def before_calculation(self):
         self.old_tests_button_text = self.precisionRecallPushButton.text()
         self.precisionRecallPushButton.setText('Calcul en cours, veuillez partientez...')
         self.precisionRecallPushButton.setEnabled(False)
 
+    def show_calculation_progress(self, evaluated_count, queries_count):
+        self.precisionRecallPushButton.setText('Calcul en cours, veuillez partientez... {}/{}'.format(
+            evaluated_count, queries_count))
+
     def afer_calculation(self):
         self.precisionRecallPushButton.setEnabled(True)
         self.precisionRecallPushButton.setText(self.old_tests_button_text)
@@ -653,11 +533,11 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         self.jaccardPrecisionLineEdit.setText("")
         self.jaccardRecallLineEdit.setText("")
 
-        query_loaded = self.load_test_queries(self.queryFileLineEdit.text())
-        qrels_loaded = self.load_query_relations(self.qrelsFileLineEdit.text())
-        if query_loaded and qrels_loaded:
+        if self.check_query(self.queryFileLineEdit.text()) and self.check_qrels(self.qrelsFileLineEdit.text()):
+            self.test_collection = TestCollection(self.queryFileLineEdit.text(), self.qrelsFileLineEdit.text())
             calculation_thread = MainWindow.PrecisionRecallThread(self)
             calculation_thread.started.connect(self.before_calculation)
+            calculation_thread.progress.connect(self.show_calculation_progress)
             calculation_thread.finished.connect(self.afer_calculation)
             calculation_thread.start()
 
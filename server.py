@@ -0,0 +1,278 @@
+"""
+Local HTTP/JSON search server answering many clients from one inverse file.
+The queries are scored in a pool of worker processes, each mapping the same inverse file (the pages are shared), and
+the queries arriving together are sent to a worker as one batch.
+
+GET  /search?q=...&model=cos&k=10   ranked search, model among inner_product, dice, cos, jaccard, bm25, dirichlet
+                                    and matching_score
+GET  /boolean?q=...                 boolean search
+POST /batch                         {"queries": [{"q": ..., "model": ..., "k": ...}, ...]}, model may be "boolean"
+GET  /stats                         requests, timeouts, QPS and p50/p99 latencies over the last seconds
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+from os.path import join, dirname
+from urllib.parse import urlsplit, parse_qs
+
+from core import InverseFileReader, QueryPreprocessing
+
+common_words_default_path = join(dirname(__file__), 'cacm', 'common_words')
+ranked_models = ('inner_product', 'dice', 'cos', 'jaccard', 'bm25', 'dirichlet', 'matching_score')
+
+inverse_file_reader = None  # Reader of a worker process.
+
+
+def open_inverse_file(inverse_file_path, common_words_path):  # Initializer of the worker processes.
+    global inverse_file_reader
+    QueryPreprocessing.load_stop_list(common_words_path)
+    inverse_file_reader = InverseFileReader(inverse_file_path)
+
+
+def run_queries(queries):
+    """
+    Worker task: answer a batch of queries.
+    :param queries: list of (query, model, k) tuples, model being one of ranked_models or 'boolean'.
+    :return: list of dicts, each with the 'results' of a query or its 'error'.
+    """
+    answers = []
+    for query, model, k in queries:
+        try:
+            if model == 'boolean':
+                answers.append({'results': inverse_file_reader.search_query_boolean(query)})
+            elif model == 'matching_score':
+                answers.append({'results': inverse_file_reader.search_query_matching_score(query, k)})
+            else:
+                answers.append({'results': inverse_file_reader.search_query_vector(query, model, k)})
+        except ValueError as err:
+            answers.append({'error': str(err)})
+        except Exception as err:  # A query the engine cannot answer, such as one too deeply nested, fails alone.
+            answers.append({'error': '{}: {}'.format(type(err).__name__, err)})
+    return answers
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[round(fraction * (len(sorted_values) - 1))] if sorted_values else None
+
+
+class QueryBatcher:
+    """
+    Gather the queries submitted within a short delay into one task of the worker pool, which saves a round trip to a
+    worker for each query under load.
+    """
+
+    def __init__(self, pool, batch_size, batch_delay):
+        """
+        :param pool: ProcessPoolExecutor whose workers were initialised by open_inverse_file.
+        :param batch_size: int maximum number of queries sent to a worker at a time.
+        :param batch_delay: float seconds a query waits for others before its batch is sent.
+        """
+        self.pool = pool
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.pending = []  # (query, future) waiting for the next batch.
+        self.flush_handle = None
+
+    def submit(self, query, model, k):
+        """
+        :return: asyncio.Future of the answer of the query, see run_queries.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append(((query, model, k), future))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        elif self.flush_handle is None:
+            self.flush_handle = loop.call_later(self.batch_delay, self.flush)
+        return future
+
+    def flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        batch, self.pending = self.pending, []
+        task = asyncio.wrap_future(self.pool.submit(run_queries, [query for query, _ in batch]))
+        task.add_done_callback(lambda done: self.resolve(batch, done))
+
+    @staticmethod
+    def resolve(batch, task):
+        for index, (_, future) in enumerate(batch):
+            if future.done():  # Timed out.
+                continue
+            if task.cancelled():
+                future.cancel()
+            elif task.exception() is not None:
+                future.set_exception(task.exception())
+            else:
+                future.set_result(task.result()[index])
+
+
+class SearchServer:
+    """
+    HTTP/1.1 server (with keep-alive) dispatching the queries to a QueryBatcher.
+    """
+
+    def __init__(self, inverse_file_path, common_words_path, workers=None, batch_size=32, batch_delay=0.002,
+                 timeout=5.0, stats_window=10.0):
+        """
+        :param inverse_file_path: str representing the path of the inverse file.
+        :param common_words_path: str representing the path of the stop list.
+        :param workers: int number of worker processes, None for one per core.
+        :param batch_size: int, see QueryBatcher.
+        :param batch_delay: float, see QueryBatcher.
+        :param timeout: float seconds after which a request is answered with 504 Gateway Timeout.
+        :param stats_window: float seconds of recent requests used by the QPS and the latency percentiles.
+        """
+        InverseFileReader(inverse_file_path)  # Fail now on an invalid file rather than in the workers.
+        self.pool = ProcessPoolExecutor(workers, initializer=open_inverse_file,
+                                        initargs=(inverse_file_path, common_words_path))
+        self.batcher = QueryBatcher(self.pool, batch_size, batch_delay)
+        self.timeout = timeout
+        self.stats_window = stats_window
+        self.latencies = deque()  # (end time, latency) of the recent requests.
+        self.requests_count = 0
+        self.timeouts_count = 0
+        self.errors_count = 0
+        self.start_time = time.perf_counter()
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print('Listening on http://{}:{}'.format(host, port), file=sys.stderr)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.pool.shutdown(cancel_futures=True)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                start = time.perf_counter()
+                try:
+                    method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                    status, response = await self.respond(method, target, body)
+                except (ValueError, KeyError, TypeError) as err:  # Malformed request or JSON body.
+                    status, response = HTTPStatus.BAD_REQUEST, {'error': 'Invalid request: {}'.format(err)}
+                except Exception as err:  # The connection is answered whatever happened, a lost worker for example.
+                    status, response = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': 'Internal error: {}'.format(err)}
+                end = time.perf_counter()
+                self.record(status, start, end)
+                payload = json.dumps(response).encode()
+                writer.write('HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n\r\n'.format(
+                    status.value, status.phrase, len(payload)).encode('latin-1') + payload)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):  # Closed or unreadable connection.
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, method, target, body):
+        """
+        :return: tuple of the HTTPStatus and the JSON response.
+        :raise ValueError, KeyError or TypeError: if the request is invalid.
+        """
+        url = urlsplit(target)
+        parameters = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        if url.path == '/stats' and method == 'GET':
+            return HTTPStatus.OK, self.stats()
+        if url.path in ('/search', '/boolean') and method == 'GET':
+            model = 'boolean' if url.path == '/boolean' else parameters.get('model', 'cos')
+            queries = [{'q': parameters.get('q', ''), 'model': model, 'k': parameters.get('k', 10)}]
+        elif url.path == '/batch' and method == 'POST':
+            queries = json.loads(body.decode())['queries']
+        elif url.path in ('/stats', '/search', '/boolean', '/batch'):
+            return HTTPStatus.METHOD_NOT_ALLOWED, {'error': 'Method not allowed'}
+        else:
+            return HTTPStatus.NOT_FOUND, {'error': 'Not found'}
+        futures = [self.batcher.submit(*self.parse_query(query)) for query in queries]
+        try:
+            answers = await asyncio.wait_for(asyncio.gather(*futures), self.timeout)
+        except asyncio.TimeoutError:
+            return HTTPStatus.GATEWAY_TIMEOUT, {'error': 'Timeout'}
+        if url.path != '/batch':
+            answer = answers[0]
+            return (HTTPStatus.BAD_REQUEST if 'error' in answer else HTTPStatus.OK), answer
+        return HTTPStatus.OK, {'answers': answers}
+
+    @staticmethod
+    def parse_query(query):
+        """
+        :param query: dict with the query 'q', the 'model' and the number of documents 'k'.
+        :return: tuple of the arguments of QueryBatcher.submit.
+        :raise ValueError: if the query is invalid.
+        """
+        if not isinstance(query, dict):
+            raise ValueError('Each query must be an object')
+        model = query.get('model', 'cos')
+        if model not in ranked_models + ('boolean',):
+            raise ValueError('Unknown model {!r}'.format(model))
+        if not isinstance(query.get('q'), str):
+            raise ValueError('The query q must be a string')
+        return query['q'], model, int(query.get('k', 10))
+
+    def record(self, status, start, end):
+        self.requests_count += 1
+        if status == HTTPStatus.GATEWAY_TIMEOUT:
+            self.timeouts_count += 1
+        elif status != HTTPStatus.OK:
+            self.errors_count += 1
+        self.latencies.append((end, end - start))
+        while self.latencies[0][0] < end - self.stats_window:
+            self.latencies.popleft()
+
+    def stats(self):
+        now = time.perf_counter()
+        latencies = sorted(latency for end, latency in self.latencies if end >= now - self.stats_window)
+        return {
+            'requests': self.requests_count,
+            'timeouts': self.timeouts_count,
+            'errors': self.errors_count,
+            'window_seconds': self.stats_window,
+            'qps': len(latencies) / min(self.stats_window, now - self.start_time),
+            'p50_ms': percentile(latencies, 0.5) * 1000 if latencies else None,
+            'p99_ms': percentile(latencies, 0.99) * 1000 if latencies else None,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('inverse_file')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--common-words', default=common_words_default_path, help='stop list file')
+    parser.add_argument('--workers', type=int, help='worker processes, one per core by default')
+    parser.add_argument('--batch-size', type=int, default=32, help='maximum queries sent to a worker at a time')
+    parser.add_argument('--batch-delay', type=float, default=0.002, help='seconds a query waits for a batch')
+    parser.add_argument('--timeout', type=float, default=5.0, help='seconds before a request times out')
+    arguments = parser.parse_args(argv)
+    try:
+        server = SearchServer(arguments.inverse_file, arguments.common_words, arguments.workers, arguments.batch_size,
+                              arguments.batch_delay, arguments.timeout)
+    except (ValueError, OSError) as err:
+        parser.exit(1, '{}\n'.format(err))
+    try:
+        asyncio.run(server.serve(arguments.host, arguments.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,269 @@
+"""
+Sharded inverse files: the collection is partitioned by document ID into shards, each with its own inverse file, and
+the queries are scattered to the shards in a pool of processes, their results being gathered into those of the whole
+collection.
+A sharded index is described by a JSON manifest naming its shard files, which are written next to it. The tf-idf
+weights of the shards are computed from the statistics of the whole collection (number of documents, documents
+frequencies and maximum frequencies of the words), so that every score is the one of the unsharded inverse file. In
+the same way, the probabilistic models score the documents of every shard with the statistics of the whole collection.
+"""
+import heapq
+import json
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from math import log10
+from os.path import join, dirname, basename
+
+from core import CACMParser, InverseFileFormat, InverseFileWriter, DocumentStoreWriter, DocumentStore, \
+    InverseFileReader, ProbabilisticScorer, QueryPreprocessing
+
+manifest_format = 'RI sharded index'
+manifest_version = 1
+
+shards_readers = {}  # Readers of the shards opened by a worker process, by path.
+
+
+def shard_of(doc_id, shards_count):
+    return doc_id % shards_count
+
+
+def build_shard(collection_path, shard_path, shard, shards_count, stop_list):
+    """
+    Worker task: write the inverse file of raw frequencies of a shard.
+    :return: int number of documents of the shard.
+    """
+    QueryPreprocessing.set_stop_list(stop_list)
+    documents = CACMParser(collection_path, select=lambda doc_id: shard_of(doc_id, shards_count) == shard)
+    return InverseFileWriter(documents, shard_path, documents_store_path='').documents_count
+
+
+def weigh_shard(frequencies_path, tf_idf_path, documents_count, words_statistics):
+    """
+    Worker task: write the tf-idf inverse file of a shard from its raw frequencies, as TfIdfFileWriter does for the
+    whole collection.
+    :param frequencies_path: str representing the path of the inverse file of raw frequencies of the shard.
+    :param tf_idf_path: str representing the path of the tf-idf inverse file of the shard.
+    :param documents_count: int number of documents of the collection.
+    :param words_statistics: dict of the words mapped to their documents frequency and maximum frequency in the
+    collection.
+    """
+    reader = InverseFileReader(frequencies_path)
+    words_documents_frequencies, words_documents_weights = {}, {}
+    for index in range(reader.get_words_count()):
+        word = reader.get_word(index).decode()
+        documents_frequency, max_frequency = words_statistics[word]
+        idf = log10(documents_count/documents_frequency+1)
+        doc_ids, frequencies = reader.decode_postings(index)
+        words_documents_frequencies[word] = dict(zip(doc_ids, frequencies))
+        words_documents_weights[word] = {
+            doc_id: frequency/max_frequency * idf for doc_id, frequency in zip(doc_ids, frequencies)
+        }
+    InverseFileFormat.write(tf_idf_path, words_documents_weights, InverseFileWriter.documents_statistics(
+        words_documents_frequencies, words_documents_weights
+    ))
+
+
+def open_shards(stop_list):  # Initializer of the worker processes of a ShardedInverseFileReader.
+    QueryPreprocessing.set_stop_list(stop_list)
+
+
+def search_shard(shard_path, search, arguments):
+    """
+    Worker task: run a search method of InverseFileReader on a shard.
+    """
+    reader = shards_readers.get(shard_path)
+    if reader is None:
+        reader = shards_readers[shard_path] = InverseFileReader(shard_path)
+    return getattr(reader, search)(*arguments)
+
+
+class ShardedIndexWriter:
+    """
+    Writer of a sharded index: the shards are built in parallel, each worker parsing only the documents of its shard.
+    """
+
+    def __init__(self, collection_path, manifest_path, shards_count, tf_idf=False, processes=None):
+        """
+        Generate the inverse files of the shards of a collection, their manifest and the document store of the whole
+        collection (see DocumentStore.path_for the manifest).
+        :param collection_path: str representing the path of the CACM collection file.
+        :param manifest_path: str representing the path of the manifest, the shards being written next to it.
+        :param shards_count: int number of shards, a document going to the shard of its ID modulo shards_count.
+        :param tf_idf: bool, weight the words by tf-idf instead of raw frequencies.
+        :param processes: int number of worker processes, None for one per core.
+        """
+        shards_paths = ['{}.{}'.format(manifest_path, shard) for shard in range(shards_count)]
+        stop_list = QueryPreprocessing.stop_list
+        with ProcessPoolExecutor(processes) as pool, tempfile.TemporaryDirectory() as frequencies_directory:
+            frequencies_paths = [join(frequencies_directory, str(shard)) for shard in range(shards_count)] \
+                if tf_idf else shards_paths
+            futures = [
+                pool.submit(build_shard, collection_path, path, shard, shards_count, stop_list)
+                for shard, path in enumerate(frequencies_paths)
+            ]
+            documents_store = DocumentStoreWriter(DocumentStore.path_for(manifest_path), collection_path)
+            try:  # The document store is kept only once every shard is written.
+                for document in CACMParser(collection_path):
+                    documents_store.add(document)
+                self.documents_count = sum(future.result() for future in futures)
+                if tf_idf:
+                    words_statistics = {}  # Word -> [documents frequency, maximum frequency] in the collection.
+                    for path in frequencies_paths:
+                        reader = InverseFileReader(path)
+                        for index in range(reader.get_words_count()):
+                            statistics = words_statistics.setdefault(reader.get_word(index).decode(), [0, 0])
+                            statistics[0] += reader.documents_frequencies[index]
+                            statistics[1] = max(statistics[1], int(reader.max_weights[index]))
+                    for future in [
+                        pool.submit(weigh_shard, frequencies_path, shard_path, self.documents_count, words_statistics)
+                        for frequencies_path, shard_path in zip(frequencies_paths, shards_paths)
+                    ]:
+                        future.result()
+            except BaseException:
+                documents_store.abort()
+                raise
+            documents_store.close()
+        with open(manifest_path, 'w') as manifest_file:
+            json.dump({
+                'format': manifest_format,
+                'version': manifest_version,
+                'shards': [basename(path) for path in shards_paths],
+                'documents_count': self.documents_count,
+                'tf_idf': tf_idf,
+            }, manifest_file, indent=2)
+
+
+class ShardedInverseFileReader:
+    """
+    Coordinator searching a sharded index like an InverseFileReader: each query is sent to every shard in a pool of
+    processes, and the top k lists of the shards are merged into the k best documents of the collection.
+    """
+
+    def __init__(self, manifest_path, processes=None):
+        """
+        :param manifest_path: str representing the path of the manifest.
+        :param processes: int number of worker processes, one for each shard by default.
+        :raise ValueError: if the file is not a supported manifest.
+        """
+        manifest = ShardedInverseFileReader.read_manifest(manifest_path)
+        self.filepath = manifest_path
+        self.shards_paths = [join(dirname(manifest_path), name) for name in manifest['shards']]
+        for path in self.shards_paths:
+            InverseFileReader(path)  # Fail now on a missing or invalid shard rather than in the workers.
+        self.pool = ProcessPoolExecutor(processes or len(self.shards_paths), initializer=open_shards,
+                                        initargs=(QueryPreprocessing.stop_list,))
+        self.documents_count = sum(self.scatter('get_documents_count'))
+
+    @staticmethod
+    def read_manifest(path):
+        """
+        :return: dict of the manifest.
+        :raise ValueError: if the file is not a supported manifest.
+        """
+        with open(path, 'rb') as manifest_file:
+            if manifest_file.read(1) != b'{':
+                raise ValueError('{} is not a sharded index manifest'.format(path))
+            manifest_file.seek(0)
+            manifest = json.loads(manifest_file.read().decode())
+        if manifest.get('format') != manifest_format:
+            raise ValueError('{} is not a sharded index manifest'.format(path))
+        if manifest.get('version') != manifest_version:
+            raise ValueError('Unsupported sharded index version {}'.format(manifest.get('version')))
+        return manifest
+
+    @staticmethod
+    def is_manifest(path):
+        try:
+            ShardedInverseFileReader.read_manifest(path)
+        except (ValueError, OSError):
+            return False
+        return True
+
+    def close(self):
+        self.pool.shutdown()
+
+    def scatter(self, search, *arguments):
+        """
+        Run a search method of InverseFileReader on every shard.
+        :return: list of the results of the shards.
+        """
+        futures = [self.pool.submit(search_shard, path, search, arguments) for path in self.shards_paths]
+        return [future.result() for future in futures]
+
+    @staticmethod
+    def gather(shards_results, k):
+        """
+        Merge the results of the shards, whose documents are disjoint.
+        :param shards_results: list of dicts of document IDs and scores, or if k is given of lists of (document ID,
+        score) sorted by decreasing score then increasing ID.
+        :return: dict of the document IDs and scores, or if k is given the k best (document ID, score).
+        """
+        if k is None:
+            merged = {}
+            for results in shards_results:
+                merged.update(results)
+            return merged
+        return list(islice(heapq.merge(*shards_results, key=lambda result: (-result[1], result[0])), k))
+
+    def get_documents_count(self):
+        return self.documents_count
+
+    def search_query_matching_score(self, query, k=None):
+        """
+        See InverseFileReader.search_query_matching_score.
+        """
+        return self.gather(self.scatter('search_query_matching_score', query, k), k)
+
+    def search_query_boolean(self, boolean_query):
+        """
+        See InverseFileReader.search_query_boolean. The negations are taken within each shard, whose documents
+        together are those of the collection.
+        """
+        return list(heapq.merge(*self.scatter('search_query_boolean', boolean_query)))
+
+    def collection_statistics(self, query_words):
+        """
+        See InverseFileReader.collection_statistics: the sums of the statistics of the shards.
+        """
+        documents_count = collection_length = 0
+        words_statistics = {}  # Word -> [documents frequency, collection frequency] in the collection.
+        for shard_statistics in self.scatter('collection_statistics', query_words):
+            documents_count += shard_statistics[0]
+            collection_length += shard_statistics[1]
+            for word, documents_frequency, collection_frequency in shard_statistics[2]:
+                statistics = words_statistics.setdefault(word, [0, 0.0])
+                statistics[0] += documents_frequency
+                statistics[1] += collection_frequency
+        return documents_count, collection_length, tuple(
+            (word, documents_frequency, collection_frequency)
+            for word, (documents_frequency, collection_frequency) in words_statistics.items()
+        )
+
+    def search_query_models(self, query, models, k):
+        """
+        See InverseFileReader.search_query_models.
+        """
+        shards_results = self.scatter('search_query_models', query, models, k)
+        return {model: self.gather([results[model] for results in shards_results], k) for model in models}
+
+    def search_query_vector(self, query, model, k=None):
+        """
+        See InverseFileReader.search_query_vector. The probabilistic models take two rounds: the statistics of the
+        collection are gathered from the shards, then sent back with the query.
+        """
+        if model in ProbabilisticScorer.models:
+            statistics = self.collection_statistics(QueryPreprocessing.analyzer.query_tokens(query))
+            return self.gather(self.scatter('search_query_vector', query, model, k, statistics,
+                                            ProbabilisticScorer.parameters()), k)
+        return self.gather(self.scatter('search_query_vector', query, model, k), k)
+
+
+def open_index(path, processes=None):
+    """
+    Open an inverse file or a sharded index.
+    :return: InverseFileReader or ShardedInverseFileReader instance.
+    """
+    if ShardedInverseFileReader.is_manifest(path):
+        return ShardedInverseFileReader(path, processes)
+    return InverseFileReader(path)
@@ -0,0 +1,269 @@
+"""
+Generator of synthetic collections in the CACM format, of any number of documents, with their test queries.
+The words are drawn from a Zipf distribution whose exponent is fitted to the real collection, over its vocabulary
+extended with made up words as Heaps' law predicts for the size of the synthetic collection. The lengths of the
+documents, their authors and citations, the lengths of the queries and their numbers of relevant documents are
+sampled from the real files. Each query is about a few topic words which are written into its relevant documents.
+
+python synthetic.py 1000000 output_directory --seed 1
+"""
+import argparse
+import random
+import re
+import sys
+import time
+from itertools import accumulate
+from math import log, exp
+from os import makedirs
+from os.path import join, dirname
+
+from core import Analyzer
+from evaluation import TestCollection
+
+cacm_all_default_path = join(dirname(__file__), 'cacm', 'cacm.all')
+query_default_path = join(dirname(__file__), 'cacm', 'query.text')
+qrels_default_path = join(dirname(__file__), 'cacm', 'qrels.text')
+months = ('January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October',
+          'November', 'December')
+
+
+def fit_power_law(points):
+    """
+    Fit y = a * x ** b by least squares over the logarithms.
+    :param points: list of (x, y) tuples of positive numbers.
+    :return: tuple of a and b.
+    """
+    xs = [log(x) for x, _ in points]
+    ys = [log(y) for _, y in points]
+    x_mean, y_mean = sum(xs) / len(xs), sum(ys) / len(ys)
+    b = sum((x - x_mean) * (y - y_mean) for x, y in zip(xs, ys)) / sum((x - x_mean) ** 2 for x in xs)
+    return exp(y_mean - b * x_mean), b
+
+
+def log_spaced(count, step=1.1):  # Increasing ints from 1 to count, about evenly spaced on a log scale.
+    return sorted({min(count, round(step ** power)) for power in range(int(log(count) / log(step)) + 2)})
+
+
+class CollectionModel:
+    """
+    Statistics of a real collection and its test queries, from which synthetic ones are generated.
+    """
+
+    def __init__(self, collection_path, queries_path, relations_path):
+        """
+        Read a collection and fit its statistics.
+        :param collection_path: str representing the path of the CACM collection file.
+        :param queries_path: str representing the path of the queries file (query.text).
+        :param relations_path: str representing the path of the relevance judgments file (qrels.text).
+        """
+        counts = {}
+        growth = []  # (number of words read, number of distinct words) after each document.
+        words_count = 0
+        self.profiles = []  # (title length, summary length, authors, citations count) of each document.
+        self.years = []
+        with open(collection_path) as collection_file:
+            documents = re.split(r'^\.I \d+[ \t]*$', collection_file.read(), flags=re.MULTILINE)[1:]
+        for document in documents:
+            parts = re.split(r'^(\.[A-Z])[ \t\r]*$', document, flags=re.MULTILINE)
+            sections = dict(zip(parts[1::2], parts[2::2]))
+            title = Analyzer.token_regexp.findall(sections.get('.T', '').lower())
+            summary = Analyzer.token_regexp.findall(sections.get('.W', '').lower())
+            for token in title + summary:
+                counts[token] = counts.get(token, 0) + 1
+            words_count += len(title) + len(summary)
+            growth.append((words_count, len(counts)))
+            authors = tuple(line.strip() for line in sections.get('.A', '').splitlines() if line.strip())
+            citations_count = sum(1 for line in sections.get('.X', '').splitlines() if line.strip())
+            self.profiles.append((len(title), len(summary), authors, citations_count))
+            year = re.search(r'\d{4}', sections.get('.B', ''))
+            if year:
+                self.years.append(int(year.group(0)))
+        self.vocabulary = sorted(counts, key=counts.get, reverse=True)  # By decreasing frequency.
+        frequencies = [counts[word] for word in self.vocabulary]
+        # The ranks are log-spaced so that the long tail of the rare words does not outweigh the head, and the ranks
+        # of the words seen once, which all share the same frequency, are left out.
+        last_rank = next((rank for rank, frequency in enumerate(frequencies, 1) if frequency == 1), len(frequencies))
+        _, slope = fit_power_law([(rank, frequencies[rank - 1]) for rank in log_spaced(last_rank)])
+        self.zipf_exponent = -slope  # Frequency of the word of rank r proportional to r ** -zipf_exponent.
+        # The first tenth of the collection is left out of the growth of the vocabulary: its few documents, which
+        # are mostly titles alone, bring new words at a rate that does not last.
+        sampled_growth = [growth[index - 1] for index in log_spaced(len(growth)) if index >= len(growth) // 10]
+        self.heaps_coefficient, self.heaps_exponent = fit_power_law(sampled_growth)  # V = K * N ** beta.
+        self.words_per_document = words_count / len(documents)
+        queries = TestCollection.read_queries(queries_path)
+        self.query_lengths = [len(Analyzer.token_regexp.findall(query.lower())) for query in queries.values()]
+        relevant_counts = {}
+        with open(relations_path) as qrels_text:
+            for line in qrels_text:
+                query_id = int(line.split()[0])
+                relevant_counts[query_id] = relevant_counts.get(query_id, 0) + 1
+        self.relevant_counts = list(relevant_counts.values())
+
+    def vocabulary_size(self, documents_count):
+        """
+        :return: int number of distinct words expected by Heaps' law in a collection of documents_count documents.
+        """
+        return round(self.heaps_coefficient * (documents_count * self.words_per_document) ** self.heaps_exponent)
+
+
+class CollectionGenerator:
+    """
+    Writer of a synthetic collection and of its queries and relevance judgments.
+    The same model, number of documents and seed always give the same files, whatever the order they are written in:
+    the collection and the queries are each drawn from a random generator of their own, seeded from the seed.
+    """
+
+    topic_ranks = (100, 5000)  # Ranks of the words chosen as topics: neither stop words nor too rare.
+    topic_probability = 0.8  # Probability of each topic word of a query to be written into a relevant document.
+
+    def __init__(self, model, documents_count, queries_count=64, seed=0, vocabulary_size=None):
+        """
+        Prepare the vocabulary and the queries.
+        :param model: CollectionModel instance.
+        :param documents_count: int number of documents.
+        :param queries_count: int number of queries.
+        :param seed: int seed of the random generator.
+        :param vocabulary_size: int number of distinct words, fitted by the model by default.
+        """
+        self.model = model
+        self.documents_count = documents_count
+        self.seed = seed
+        self.random = random.Random(seed)
+        vocabulary_size = vocabulary_size or max(self.topic_ranks[1], model.vocabulary_size(documents_count))
+        self.vocabulary = model.vocabulary[:vocabulary_size]
+        self.vocabulary.extend(self.made_up_words(vocabulary_size - len(self.vocabulary)))
+        self.cumulative_weights = list(accumulate(
+            rank ** -model.zipf_exponent for rank in range(1, len(self.vocabulary) + 1)
+        ))
+        low, high = self.topic_ranks
+        topic_words = self.vocabulary[min(low, len(self.vocabulary) // 2):high]
+        self.queries = []  # (topic words, relevant documents IDs) of each query.
+        self.topics = {}  # Document ID -> topic words of the queries it is relevant to.
+        for _ in range(queries_count):
+            topic = self.random.sample(topic_words, min(len(topic_words), self.random.randint(2, 4)))
+            relevant_count = min(documents_count, self.random.choice(model.relevant_counts))
+            relevant_documents = sorted(self.random.sample(range(1, documents_count + 1), relevant_count))
+            self.queries.append((topic, relevant_documents))
+            for doc_id in relevant_documents:
+                self.topics.setdefault(doc_id, []).extend(topic)
+
+    def made_up_words(self, count):
+        """
+        :return: list of count distinct lowercase words which are not in the real vocabulary.
+        """
+        known = set(self.model.vocabulary)
+        consonants, vowels = 'bcdfghjklmnprstvz', 'aeiou'
+        words = []
+        while len(words) < count:
+            word = ''.join(self.random.choice(consonants) + self.random.choice(vowels)
+                           for _ in range(self.random.randint(2, 4)))
+            if word not in known:
+                known.add(word)
+                words.append(word)
+        return words
+
+    def words(self, count):
+        return self.random.choices(self.vocabulary, cum_weights=self.cumulative_weights, k=count) if count else []
+
+    @staticmethod
+    def lines(words, width=75):  # Text of the words, wrapped as in the collection.
+        lines, line = [], []
+        length = 0
+        for word in words:
+            if line and length + len(word) >= width:
+                lines.append(' '.join(line))
+                line, length = [], 0
+            line.append(word)
+            length += len(word) + 1
+        lines.append(' '.join(line))
+        return '\n'.join(lines)
+
+    def document(self, doc_id):
+        """
+        :return: str text of a document, from its '.I' line.
+        """
+        title_length, summary_length, authors, citations_count = self.random.choice(self.model.profiles)
+        title = self.words(max(1, title_length))
+        summary = self.words(summary_length)
+        for word in self.topics.get(doc_id, ()):
+            if self.random.random() < self.topic_probability:
+                text = summary if summary and self.random.random() < 0.8 else title
+                text.insert(self.random.randint(0, len(text)), word)
+        year = self.random.choice(self.model.years)
+        month = self.random.randint(1, 12)
+        parts = ['.I {}\n.T\n{}\n'.format(doc_id, self.lines([title[0].capitalize()] + title[1:]))]
+        if summary:
+            parts.append('.W\n{}.\n'.format(self.lines(summary)))
+        parts.append('.B\nCACM {}, {}\n'.format(months[month - 1], year))
+        if authors:
+            parts.append('.A\n{}\n'.format('\n'.join(authors)))
+        parts.append('.N\nCA{:02d}{:02d}{:02d} JB March {}, 1978  {}:{:02d} PM\n'.format(
+            year % 100, month, self.random.randint(1, 28), self.random.randint(1, 31), self.random.randint(1, 12),
+            self.random.randint(0, 59)))
+        parts.append('.X\n')
+        for _ in range(citations_count):
+            parts.append('{}\t{}\t{}\n'.format(self.random.randint(1, self.documents_count), self.random.randint(4, 6),
+                                               doc_id))
+        return ''.join(parts)
+
+    def write_collection(self, path, progress=None):
+        """
+        Write the documents one at a time, so that memory does not depend on their number.
+        :param path: str representing the path of the collection file.
+        :param progress: function called with the number of documents written every 100000 documents.
+        """
+        self.random = random.Random('{} collection'.format(self.seed))
+        with open(path, 'w', buffering=1 << 20) as collection_file:
+            for doc_id in range(1, self.documents_count + 1):
+                collection_file.write(self.document(doc_id))
+                if progress is not None and doc_id % 100000 == 0:
+                    progress(doc_id)
+
+    def write_queries(self, queries_path, relations_path):
+        """
+        Write the queries (query.text format) and their relevant documents (qrels.text format).
+        Each query is made of its topic words among words drawn like those of the documents.
+        """
+        self.random = random.Random('{} queries'.format(self.seed))
+        with open(queries_path, 'w') as query_text, open(relations_path, 'w') as qrels_text:
+            for query_id, (topic, relevant_documents) in enumerate(self.queries, 1):
+                words = self.words(max(0, self.random.choice(self.model.query_lengths) - len(topic))) + topic
+                self.random.shuffle(words)
+                query_text.write('.I {}\n.W\n {}\n.N\n {}. Synthetic query ({})\n \n'.format(
+                    query_id, self.lines(words), query_id, ' '.join(topic)))
+                for doc_id in relevant_documents:
+                    qrels_text.write('{:02d} {} 0 0\n'.format(query_id, doc_id))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('documents', type=int, help='number of documents')
+    parser.add_argument('output_directory', help='directory of the cacm.all, query.text and qrels.text files')
+    parser.add_argument('--queries', type=int, default=64, help='number of queries')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random generator')
+    parser.add_argument('--vocabulary-size', type=int, help="distinct words, fitted by Heaps' law by default")
+    parser.add_argument('--collection', default=cacm_all_default_path, help='real CACM collection file')
+    parser.add_argument('--real-queries', default=query_default_path, help='real queries file')
+    parser.add_argument('--real-qrels', default=qrels_default_path, help='real relevance judgments file')
+    arguments = parser.parse_args(argv)
+    if arguments.documents < 1:
+        parser.error('the number of documents must be positive')
+    start = time.perf_counter()
+    try:
+        model = CollectionModel(arguments.collection, arguments.real_queries, arguments.real_qrels)
+        generator = CollectionGenerator(model, arguments.documents, arguments.queries, arguments.seed,
+                                        arguments.vocabulary_size)
+        makedirs(arguments.output_directory, exist_ok=True)
+        generator.write_queries(join(arguments.output_directory, 'query.text'),
+                                join(arguments.output_directory, 'qrels.text'))
+        generator.write_collection(join(arguments.output_directory, 'cacm.all'),
+                                   lambda count: print('{} documents written'.format(count), file=sys.stderr))
+    except (ValueError, OSError) as err:
+        parser.exit(1, '{}\n'.format(err))
+    print('Zipf exponent {:.3f}, {} distinct words, {} documents written in {:.1f}s'.format(
+        model.zipf_exponent, len(generator.vocabulary), arguments.documents, time.perf_counter() - start),
+        file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()